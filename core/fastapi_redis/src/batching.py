@@ -0,0 +1,120 @@
+import asyncio
+from bisect import bisect_left
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+# Upper bounds of the batch size histogram, in rows
+BATCH_SIZE_BUCKETS = [1, 8, 32, 128, 512, 2048]
+
+
+class MicroBatcher:
+    """Coalesce concurrent requests into batches.
+
+    A batch is flushed when it reaches `max_batch_size` rows, or `max_wait`
+    seconds after its first request arrived. The handler receives the list of
+    payloads of the batch and returns one result per payload, in order, which
+    are then handed back to the waiting callers. If the handler fails on a
+    batch, each of its payloads is retried alone, so that one bad payload only
+    fails its own caller.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[list], Awaitable[list]],
+        max_batch_size: int = 512,
+        max_wait: float = 0.002,
+    ):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.pending: list[tuple[Any, asyncio.Future]] = []
+        self.pending_rows: int = 0
+        self.timer: asyncio.TimerHandle | None = None
+        self.tasks: set[asyncio.Task] = set()
+        # Counters
+        self.batches: int = 0
+        self.requests: int = 0
+        self.rows: int = 0
+        self.failed_batches: int = 0
+        self.batch_size_counts: list[int] = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+
+    async def submit(self, payload: Any, n_rows: int) -> Any:
+        """Add the payload to the current batch and wait for its result
+
+        Args:
+            payload (Any): payload passed to the handler
+            n_rows (int): number of rows of the payload
+
+        Returns:
+            Any: result of the handler for this payload
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((payload, future))
+        self.pending_rows += n_rows
+
+        if self.pending_rows >= self.max_batch_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.max_wait, self.flush)
+
+        return await future
+
+    def flush(self) -> None:
+        """Hand the current batch over to the handler"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending:
+            return
+
+        batch, rows = self.pending, self.pending_rows
+        self.pending, self.pending_rows = [], 0
+
+        self.batches += 1
+        self.requests += len(batch)
+        self.rows += rows
+        self.batch_size_counts[bisect_left(BATCH_SIZE_BUCKETS, rows)] += 1
+
+        # Keep a reference to the task until it is done
+        task = asyncio.create_task(self.run(batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def run(self, batch: list[tuple[Any, asyncio.Future]]) -> None:
+        """Run the handler on the batch and fan the results out"""
+        try:
+            results = await self.handler([payload for payload, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                future = batch[0][1]
+                if not future.done():
+                    future.set_exception(e)
+                return
+            self.failed_batches += 1
+            # Find the failing payloads: run the handler on each one alone
+            await asyncio.gather(*(self.run([item]) for item in batch))
+            return
+
+        for (_, future), result in zip(batch, results):
+            # The caller may have been cancelled, e.g. client disconnected
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        """Return the counters of the batcher"""
+        labels = [f"<={bound}" for bound in BATCH_SIZE_BUCKETS]
+        labels.append(f">{BATCH_SIZE_BUCKETS[-1]}")
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "requests": self.requests,
+            "rows": self.rows,
+            "failed_batches": self.failed_batches,
+            "mean_requests_per_batch": (
+                self.requests / self.batches if self.batches else 0.0
+            ),
+            "mean_rows_per_batch": self.rows / self.batches if self.batches else 0.0,
+            "rows_per_batch": dict(zip(labels, self.batch_size_counts)),
+        }
@@ -0,0 +1,94 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import redis
+
+from data import venue_data_preprocessing
+from serialization import get_codec
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        description="Compare the venue serialization formats stored in Redis"
+    )
+    parser.add_argument("--data-path", default="data/venues.csv")
+    parser.add_argument(
+        "--batch-size", type=int, default=100, help="Venues fetched per MGET."
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=200, help="Number of MGET per format."
+    )
+    return parser.parse_args(argv)
+
+
+def benchmark_codec(
+    r: redis.Redis, name: str, venue_df: pd.DataFrame, batch_size: int, repeat: int
+) -> dict:
+    """Store the venues with one codec under a dedicated prefix,
+    then measure the bytes stored, the MGET latency and the decode time
+
+    Args:
+        r (redis.Redis): Redis client
+        name (str): name of the codec
+        venue_df (pd.DataFrame): preprocessed venue data
+        batch_size (int): number of venues fetched per MGET
+        repeat (int): number of MGET
+
+    Returns:
+        dict: results of the benchmark
+    """
+    n_features = venue_df.shape[1] - 1
+    codec = get_codec(name, n_features)
+    prefix = f"benchmark:{name}:"
+
+    keys = [prefix + str(key) for key in venue_df.venue_id.values.tolist()]
+    values = [codec.encode(value) for value in venue_df.iloc[:, 1:].values.tolist()]
+    r.mset(dict(zip(keys, values)))
+
+    rng = np.random.default_rng(42)
+    out = np.empty((batch_size, n_features))
+    mget_time, decode_time = [], []
+    for _ in range(repeat):
+        batch = [keys[i] for i in rng.integers(0, len(keys), batch_size)]
+
+        start = time.perf_counter()
+        blobs = r.mget(batch)
+        mget_time.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        codec.decode_into(blobs, out)
+        decode_time.append(time.perf_counter() - start)
+
+    r.delete(*keys)
+    return {
+        "format": name,
+        "bytes/venue": sum(len(value) for value in values) / len(values),
+        "mget p50 (ms)": np.percentile(mget_time, 50) * 1000,
+        "mget p99 (ms)": np.percentile(mget_time, 99) * 1000,
+        "decode p50 (us)": np.percentile(decode_time, 50) * 1e6,
+        "decode p99 (us)": np.percentile(decode_time, 99) * 1e6,
+    }
+
+
+def main(args):
+    r = redis.Redis(
+        host=os.getenv("REDIS_HOST"),
+        port=os.getenv("REDIS_PORT"),
+        password=os.getenv("REDIS_PASSWORD"),
+        decode_responses=False,
+    )
+    venue_df = venue_data_preprocessing(pd.read_csv(args.data_path))
+
+    results = [
+        benchmark_codec(r, name, venue_df, args.batch_size, args.repeat)
+        for name in ("pickle", "float64", "float32")
+    ]
+    print(pd.DataFrame(results).to_string(index=False, float_format="%.3f"))
+
+
+if __name__ == "__main__":
+    main(parse_arguments(sys.argv[1:]))
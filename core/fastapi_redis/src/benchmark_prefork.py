@@ -0,0 +1,133 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmark_startup import wait_for
+from load_test import free_port, make_payloads, run_http, start_fake_redis
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        description="Compare the throughput and memory of the pre-fork server "
+        "with uvicorn workers, for growing numbers of workers"
+    )
+    parser.add_argument(
+        "--fake-redis",
+        action="store_true",
+        help="Serve the app from an in-memory Redis (requires fakeredis).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4],
+        help="Numbers of workers to test.",
+    )
+    parser.add_argument(
+        "--servers",
+        nargs="+",
+        choices=["prefork", "uvicorn"],
+        default=["prefork", "uvicorn"],
+        help="prefork: prefork.py, uvicorn: uvicorn --workers with FEATURE_STORE.",
+    )
+    parser.add_argument("--data-path", default="data/venues.csv")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--venues", type=int, default=50, help="Venues per request.")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    return parser.parse_args(argv)
+
+
+def process_tree(pid: int) -> list[int]:
+    """Return the pid and the pids of all descendants of the process"""
+    pids = [pid]
+    for parent in pids:
+        children = subprocess.run(
+            ["pgrep", "-P", str(parent)], capture_output=True, text=True
+        ).stdout.split()
+        pids += [int(child) for child in children]
+    return pids
+
+
+def proportional_memory(pids: list[int]) -> float:
+    """Sum of the proportional set size (PSS) of the processes, in MB: the
+    pages shared by several processes are split between them, so the sum is
+    the memory actually used by the group
+    """
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Pss:"):
+                        total += int(line.split()[1])
+        except FileNotFoundError:
+            pass
+    return total / 1024
+
+
+def start_server(server: str, workers: int, port: int) -> subprocess.Popen:
+    """Start the server with the given number of workers"""
+    if server == "prefork":
+        command = ["prefork.py", "--workers", str(workers), "--port", str(port)]
+        env = os.environ
+    else:
+        command = ["-m", "uvicorn", "main:app", "--workers", str(workers)]
+        command += ["--port", str(port)]
+        # Each worker holds its own copy of the venue table
+        env = {**os.environ, "FEATURE_STORE": "true"}
+    return subprocess.Popen(
+        [sys.executable, *command, "--log-level", "warning"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def main(args):
+    if args.fake_redis:
+        start_fake_redis()
+
+    venue_ids = pd.read_csv(args.data_path).venue_id.values.tolist()
+    payloads = make_payloads(venue_ids, args.requests, [args.venues], 0.0, 42)
+
+    results = []
+    for server in args.servers:
+        for workers in args.workers:
+            port = free_port()
+            process = start_server(server, workers, port)
+            try:
+                wait_for(f"http://127.0.0.1:{port}/readiness", process, args.timeout)
+                url = f"http://127.0.0.1:{port}/prediction/"
+                # Warm up every worker
+                run_http(url, payloads[: 20 * workers], 4 * workers)
+                start = time.perf_counter()
+                latency = run_http(url, payloads, args.concurrency)
+                elapsed = time.perf_counter() - start
+                memory = proportional_memory(process_tree(process.pid))
+            finally:
+                process.terminate()
+                process.wait()
+
+            totals = [stages["total"] for stages in latency if stages is not None]
+            results.append(
+                {
+                    "server": server,
+                    "workers": workers,
+                    "errors": len(latency) - len(totals),
+                    "requests/s": len(latency) / elapsed,
+                    "p99 (ms)": np.percentile(totals, 99) * 1000,
+                    "memory (MB)": memory,
+                }
+            )
+            print(results[-1], flush=True)
+
+    print(pd.DataFrame(results).to_string(index=False, float_format="%.1f"))
+
+
+if __name__ == "__main__":
+    main(parse_arguments(sys.argv[1:]))
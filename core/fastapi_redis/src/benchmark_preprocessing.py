@@ -0,0 +1,126 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from data import session_data_preprocessing
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        description="Benchmark session_data_preprocessing on synthetic data"
+    )
+    parser.add_argument(
+        "--sessions",
+        type=int,
+        nargs="+",
+        default=[1_000, 5_000, 20_000],
+        help="Numbers of synthetic sessions to test.",
+    )
+    parser.add_argument(
+        "--skip-reference",
+        action="store_true",
+        help="Only time the current implementation, e.g. for large sizes.",
+    )
+    return parser.parse_args(argv)
+
+
+def reference_session_data_preprocessing(session_df: pd.DataFrame) -> pd.DataFrame:
+    """Previous implementation of session_data_preprocessing, which filters the
+    NaN sessions once per purchased session. Kept as the reference output,
+    see tests/test_data.py, and timing.
+    """
+    session_df = session_df.iloc[:, 1:]
+    session_df.drop_duplicates(
+        subset=["session_id", "position_in_list", "venue_id", "purchased"],
+        keep="last",
+        inplace=True,
+    )
+    df_list = [session_df[session_df["has_seen_venue_in_this_session"] == True]]
+    nan_sessions = session_df[session_df["has_seen_venue_in_this_session"].isna()]
+    nan_sessions_purchased_index = nan_sessions[nan_sessions["purchased"] == True][
+        ["session_id", "position_in_list"]
+    ].values.tolist()
+    for session, purchased_index in nan_sessions_purchased_index:
+        df = nan_sessions[
+            (nan_sessions["session_id"] == session)
+            & (nan_sessions["position_in_list"] <= purchased_index)
+        ]
+        df_list.append(df)
+    return pd.concat(df_list)
+
+
+def synthetic_sessions(n_sessions: int, seed: int = 42) -> pd.DataFrame:
+    """Generate raw session data with the columns of data/sessions.csv:
+    sessions of 5-30 venues, about half of them without has_seen information,
+    most of them with one purchase, some with two, and duplicated rows.
+    """
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(5, 31, n_sessions)
+    session_id = np.repeat(rng.permutation(n_sessions * 10)[:n_sessions], lengths)
+    position = np.concatenate([np.arange(n) for n in lengths])
+    n_rows = len(session_id)
+
+    # Purchase at a random position of 80% of the sessions, plus a second one
+    starts = np.cumsum(lengths) - lengths
+    purchased = np.zeros(n_rows, dtype=bool)
+    buyers = rng.random(n_sessions) < 0.8
+    purchased[(starts + rng.integers(0, lengths))[buyers]] = True
+    second = rng.random(n_sessions) < 0.05
+    purchased[(starts + rng.integers(0, lengths))[second]] = True
+
+    has_seen = np.where(rng.random(n_rows) < 0.7, True, False).astype(object)
+    has_seen[np.repeat(rng.random(n_sessions) < 0.5, lengths)] = np.nan
+
+    df = pd.DataFrame(
+        {
+            "session_id": session_id,
+            "position_in_list": position,
+            "venue_id": rng.integers(-(2**62), 2**62, n_rows),
+            "purchased": purchased,
+            "has_seen_venue_in_this_session": has_seen,
+            "is_new_user": rng.random(n_rows) < 0.3,
+            "is_from_order_again": rng.random(n_rows) < 0.2,
+            "is_recommended": rng.random(n_rows) < 0.4,
+        }
+    )
+    # Duplicate 1% of the rows, as in the raw data
+    df = pd.concat([df, df.sample(frac=0.01, random_state=seed)]).sort_index()
+    df = df.reset_index(drop=True)
+    # Index column written by pandas in data/sessions.csv
+    df.insert(0, "Unnamed: 0", df.index)
+    return df
+
+
+def timed(func, df: pd.DataFrame) -> tuple[pd.DataFrame, float]:
+    """Run func on a copy of df and return its output and duration"""
+    df = df.copy()
+    start = time.perf_counter()
+    output = func(df)
+    return output, time.perf_counter() - start
+
+
+def main(args):
+    results = []
+    for n_sessions in args.sessions:
+        session_df = synthetic_sessions(n_sessions)
+        _, current_time = timed(session_data_preprocessing, session_df)
+        result = {
+            "sessions": n_sessions,
+            "rows": len(session_df),
+            "current (s)": current_time,
+        }
+
+        if not args.skip_reference:
+            _, reference_time = timed(reference_session_data_preprocessing, session_df)
+            result["reference (s)"] = reference_time
+            result["speedup"] = reference_time / current_time
+        results.append(result)
+
+    print(pd.DataFrame(results).to_string(index=False, float_format="%.3f"))
+
+
+if __name__ == "__main__":
+    main(parse_arguments(sys.argv[1:]))
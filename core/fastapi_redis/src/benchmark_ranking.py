@@ -0,0 +1,70 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from ranking import ranking_order
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the top-K ranking against a full sort"
+    )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        nargs="+",
+        default=[100, 1_000, 10_000, 100_000],
+        help="Numbers of scored venues to rank.",
+    )
+    parser.add_argument("--top-k", type=int, default=20)
+    return parser.parse_args(argv)
+
+
+def reference_ranking_order(
+    scores: np.ndarray,
+    top_k: int | None,
+    score_threshold: float | None,
+    mask: np.ndarray | None = None,
+) -> np.ndarray:
+    """Full stable sort of all venues, then filtering and truncation: the
+    reference order of ranking_order, see tests/test_ranking.py"""
+    order = np.argsort(-scores, kind="stable")
+    if score_threshold is not None:
+        order = order[scores[order] >= score_threshold]
+    if mask is not None:
+        order = order[mask[order]]
+    return order[:top_k]
+
+
+def timed(func, *args, repeat: int = 20) -> float:
+    """Return the mean duration of func(*args) in milliseconds"""
+    func(*args)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main(args):
+    rng = np.random.default_rng(0)
+    results = []
+    for n in args.candidates:
+        scores = rng.random(n)
+        full_time = timed(reference_ranking_order, scores, None, None)
+        top_k_time = timed(ranking_order, scores, args.top_k, None)
+        results.append(
+            {
+                "candidates": n,
+                "full sort (ms)": full_time,
+                f"top {args.top_k} (ms)": top_k_time,
+                "speedup": full_time / top_k_time,
+            }
+        )
+    print(pd.DataFrame(results).to_string(index=False, float_format="%.3f"))
+
+
+if __name__ == "__main__":
+    main(parse_arguments(sys.argv[1:]))
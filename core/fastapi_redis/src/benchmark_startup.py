@@ -0,0 +1,140 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from load_test import free_port, start_fake_redis
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        description="Measure the import time of the app and the time until the "
+        "server is alive and ready"
+    )
+    parser.add_argument(
+        "--fake-redis",
+        action="store_true",
+        help="Serve the app from an in-memory Redis (requires fakeredis).",
+    )
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        choices=["eager", "background"],
+        default=["eager", "background"],
+        help="STARTUP_MODE values to measure.",
+    )
+    parser.add_argument(
+        "--top", type=int, default=10, help="Slowest imported modules to show."
+    )
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument(
+        "--max-import-ms",
+        type=float,
+        default=None,
+        help="Exit with an error if importing the app takes longer than this.",
+    )
+    return parser.parse_args(argv)
+
+
+def import_time() -> tuple[float, list[tuple[int, str]]]:
+    """Import the app in a fresh interpreter with -X importtime
+
+    Returns:
+        tuple[float, list[tuple[int, str]]]: import time of main in
+            milliseconds, and cumulative time in microseconds of each module
+            imported directly by main
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = 0.0
+    modules = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        if name.strip() == "main":
+            total = int(cumulative) / 1000
+        elif name.startswith("   ") and not name.startswith("    "):
+            # Indented by one level: imported by main
+            modules.append((int(cumulative), name.strip()))
+    return total, sorted(modules, reverse=True)
+
+
+def wait_for(url: str, process: subprocess.Popen, timeout: float) -> float:
+    """Poll the URL until it answers 200, return the time it took in seconds"""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if process.poll() is not None:
+            sys.exit(f"The server exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(url) as response:
+                if response.status == 200:
+                    return time.perf_counter() - start
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.01)
+    sys.exit(f"{url} not ready after {timeout}s")
+
+
+def startup_time(mode: str, timeout: float) -> tuple[float, float]:
+    """Start a server with the given STARTUP_MODE
+
+    Returns:
+        tuple[float, float]: seconds until /healthcheck and /readiness answer
+    """
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        env={**os.environ, "STARTUP_MODE": mode},
+    )
+    try:
+        start = time.perf_counter()
+        wait_for(f"http://127.0.0.1:{port}/healthcheck", process, timeout)
+        alive = time.perf_counter() - start
+        wait_for(f"http://127.0.0.1:{port}/readiness", process, timeout)
+        ready = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+    return alive, ready
+
+
+def main(args):
+    if args.fake_redis:
+        start_fake_redis()
+
+    total, modules = import_time()
+    print(f"import main: {total:.1f}ms, slowest imports:")
+    for cumulative, name in modules[: args.top]:
+        print(f"  {name:<24} {cumulative / 1000:8.1f}ms")
+
+    for mode in args.modes:
+        alive, ready = startup_time(mode, args.timeout)
+        print(
+            f"STARTUP_MODE={mode}: alive after {alive:.3f}s, ready after {ready:.3f}s"
+        )
+
+    if args.max_import_ms is not None and total > args.max_import_ms:
+        sys.exit(f"Import time {total:.1f}ms exceeds {args.max_import_ms}ms")
+
+
+if __name__ == "__main__":
+    main(parse_arguments(sys.argv[1:]))
@@ -0,0 +1,43 @@
+import redis.asyncio
+
+
+class CountingConnectionPool(redis.asyncio.BlockingConnectionPool):
+    """Blocking connection pool of the async Redis client, counting its
+    connections as they are created, checked out and released.
+
+    The counts rely only on the methods the client calls, not on the internal
+    attributes of the pool, which change between versions of redis-py.
+    """
+
+    def reset(self) -> None:
+        """Forget all connections, also called by the pool after a fork"""
+        super().reset()
+        self.created: int = 0
+        self.checked_out: set = set()
+
+    def make_connection(self):
+        """Create a new connection"""
+        self.created += 1
+        return super().make_connection()
+
+    async def get_connection(self, command_name, *keys, **options):
+        """Check out a connection, blocking until one is available"""
+        connection = await super().get_connection(command_name, *keys, **options)
+        self.checked_out.add(connection)
+        return connection
+
+    async def release(self, connection) -> None:
+        """Release a connection back to the pool"""
+        # Also called by the pool for a connection it failed to check out
+        self.checked_out.discard(connection)
+        await super().release(connection)
+
+    def stats(self) -> dict:
+        """Return the connection counts of the pool"""
+        in_use = len(self.checked_out)
+        return {
+            "max_connections": self.max_connections,
+            "created": self.created,
+            "in_use": in_use,
+            "idle": self.created - in_use,
+        }
@@ -1,3 +1,6 @@
+import json
+
+import numpy as np
 import pandas as pd
 
 
@@ -27,43 +30,160 @@ def session_data_preprocessing(session_df: pd.DataFrame) -> pd.DataFrame:
     # 2. When has_seen_venue_in_this_session is missing,
     # only keep venues before the purchased item(<=position_in_list)
     nan_sessions = session_df[session_df["has_seen_venue_in_this_session"].isna()]
-    nan_sessions_purchased_index = nan_sessions[nan_sessions["purchased"] == True][
-        ["session_id", "position_in_list"]
-    ].values.tolist()
-    for session, purchased_index in nan_sessions_purchased_index:
-        df = nan_sessions[
-            (nan_sessions["session_id"] == session)
-            & (nan_sessions["position_in_list"] <= purchased_index)
-        ]
-        df_list.append(df)
+    purchases = nan_sessions.loc[
+        nan_sessions["purchased"] == True, ["session_id", "position_in_list"]
+    ].rename(columns={"position_in_list": "purchased_position"})
+    purchases["purchase_order"] = np.arange(len(purchases))
+    rows = nan_sessions[["session_id", "position_in_list"]].assign(
+        row=np.arange(len(nan_sessions))
+    )
+    # Pair each purchase with the rows of its session in one join,
+    # and keep the rows up to the purchased position
+    pairs = purchases.merge(rows, on="session_id")
+    pairs = pairs[pairs["position_in_list"] <= pairs["purchased_position"]]
+    # Same order as filtering the session of each purchase one after the other
+    pairs = pairs.sort_values(["purchase_order", "row"], kind="stable")
+    df_list.append(nan_sessions.iloc[pairs["row"].to_numpy()])
 
     # Concatenate dataframe from 1 and 2
     session_df = pd.concat(df_list)
     return session_df
 
 
-def venue_data_preprocessing(venue_df: pd.DataFrame) -> pd.DataFrame:
-    """Preprocess venue data
+def venue_data_cleaning(venue_df: pd.DataFrame) -> pd.DataFrame:
+    """Remove the index column of the raw venue data
 
     Args:
-        session_df (pd.DataFrame): raw venue DataFrame
+        venue_df (pd.DataFrame): raw venue DataFrame
 
     Returns:
-        pd.DataFrame: venue DataFrame after preprocessing
+        pd.DataFrame: venue_id column followed by the raw venue features
     """
-    # Remove the index columns
-    venue_df = venue_df.iloc[:, 1:]
+    return venue_df.iloc[:, 1:]
+
+
+class VenueNormalizer:
+    """Imputation & scaling of the venue features, fitted on a venue table.
+
+    The fitted statistics are saved with the model artifact, so that serving
+    normalizes the raw venue features exactly as the training data was, one
+    venue or one batch at a time, without the rest of the venue table.
+    """
+
+    # Missing values are imputed with the 30th percentile of the column
+    imputed_columns = ["conversions_per_impression", "rating", "retention_rate"]
+    imputed_quantile = 0.3
+    # Columns scaled into range [0,1] by their maximum
+    scaled_columns = ["rating", "price_range", "popularity"]
+
+    def __init__(
+        self,
+        imputation: dict[str, float] | None = None,
+        scaling: dict[str, float] | None = None,
+        defaults: dict[str, float] | None = None,
+    ):
+        self.imputation: dict[str, float] = imputation or {}
+        self.scaling: dict[str, float] = scaling or {}
+        # Raw features of the venues missing from the venue data
+        self.defaults: dict[str, float] = defaults or {}
+
+    def fit(self, venue_df: pd.DataFrame) -> "VenueNormalizer":
+        """Compute the imputation values and the scales of the venue table
+
+        Args:
+            venue_df (pd.DataFrame): venue DataFrame after cleaning
+
+        Returns:
+            VenueNormalizer: the fitted normalizer
+        """
+        quantiles = venue_df[self.imputed_columns].quantile(self.imputed_quantile)
+        self.imputation = {col: float(value) for col, value in quantiles.items()}
+        # Scales are computed after the imputation, as they are applied
+        maxima = venue_df[self.scaled_columns].fillna(value=self.imputation).max()
+        self.scaling = {col: float(value) for col, value in maxima.items()}
+        # A missing venue is given the imputed value of every feature
+        features = venue_df.drop(columns="venue_id", errors="ignore")
+        defaults = features.quantile(self.imputed_quantile)
+        self.defaults = {col: float(value) for col, value in defaults.items()}
+        return self
+
+    def transform(self, venue_df: pd.DataFrame) -> pd.DataFrame:
+        """Impute & scale the venue features of a DataFrame
 
-    # Impute missing values for venues data:
-    missing_cols = ["conversions_per_impression", "rating", "retention_rate"]
-    # Impute missing value with 30th percentile
-    imputed_values = venue_df[missing_cols].quantile(0.3).values.tolist()
-    imputed_dict = {a: b for a, b in zip(missing_cols, imputed_values)}
-    venue_df.fillna(value=imputed_dict, inplace=True)
+        Args:
+            venue_df (pd.DataFrame): venue DataFrame, with some or all venues
 
-    # Scale venue features into range [0,1]
-    venue_df["rating"] /= venue_df["rating"].max()
-    venue_df["price_range"] /= venue_df["price_range"].max()
-    venue_df["popularity"] /= venue_df["popularity"].max()
+        Returns:
+            pd.DataFrame: venue DataFrame after preprocessing
+        """
+        venue_df = venue_df.fillna(value=self.imputation)
+        for col, scale in self.scaling.items():
+            venue_df[col] = venue_df[col] / scale
+        return venue_df
 
-    return venue_df
+    def transform_features(self, features: np.ndarray, columns: list[str]) -> None:
+        """Impute & scale a venue feature matrix in place
+
+        Args:
+            features (np.ndarray): one row per venue, one column per feature
+            columns (list[str]): feature name of each column
+        """
+        fill = np.array([self.imputation.get(col, np.nan) for col in columns])
+        scale = np.array([self.scaling.get(col, 1.0) for col in columns])
+        missing = np.isnan(features)
+        if missing.any():
+            features[missing] = np.broadcast_to(fill, features.shape)[missing]
+        features /= scale
+
+    def default_features(self, columns: list[str]) -> np.ndarray:
+        """Return the raw features given to a venue missing from the venue data.
+        Statistics saved without the defaults fall back to the imputation
+        values, and to 0 for the other columns.
+
+        Args:
+            columns (list[str]): feature name of each column
+
+        Returns:
+            np.ndarray: raw feature vector, to be imputed & scaled as any venue
+        """
+        return np.array(
+            [self.defaults.get(col, self.imputation.get(col, 0.0)) for col in columns]
+        )
+
+    def save(self, path: str) -> None:
+        """Write the fitted statistics into a JSON file"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "imputation": self.imputation,
+                    "scaling": self.scaling,
+                    "defaults": self.defaults,
+                },
+                f,
+                indent=4,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "VenueNormalizer":
+        """Read the fitted statistics from a JSON file"""
+        with open(path, encoding="utf-8") as f:
+            return cls(**json.load(f))
+
+
+def venue_data_preprocessing(
+    venue_df: pd.DataFrame, normalizer: VenueNormalizer | None = None
+) -> pd.DataFrame:
+    """Preprocess venue data
+
+    Args:
+        venue_df (pd.DataFrame): raw venue DataFrame
+        normalizer (VenueNormalizer | None): fitted statistics to apply,
+            fitted on venue_df if None
+
+    Returns:
+        pd.DataFrame: venue DataFrame after preprocessing
+    """
+    venue_df = venue_data_cleaning(venue_df)
+    if normalizer is None:
+        normalizer = VenueNormalizer().fit(venue_df)
+    return normalizer.transform(venue_df)
@@ -0,0 +1,115 @@
+import hashlib
+import inspect
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# Bump to invalidate every cached dataset, e.g. when the merge changes
+CACHE_FORMAT_VERSION = "1"
+
+
+def dataset_key(paths: list[str], *code: object) -> str:
+    """Hash the content of the input files and the source code producing
+    the dataset, so that changing either gives another key
+
+    Args:
+        paths (list[str]): paths of the input data files
+        *code (object): functions or classes building the dataset
+
+    Returns:
+        str: key of the dataset
+    """
+    key = hashlib.sha256(CACHE_FORMAT_VERSION.encode())
+    for obj in code:
+        key.update(inspect.getsource(obj).encode())
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                key.update(block)
+    return key.hexdigest()
+
+
+class DatasetCache:
+    """On-disk cache of preprocessed datasets.
+
+    Each dataset is stored as one `.npy` file per column under
+    `<cache_dir>/<key>/`, and loaded back as memory-mapped arrays, so that
+    a warm run reads only the pages it touches and copies nothing up front.
+    """
+
+    def __init__(self, cache_dir: str = "cache", max_entries: int = 3):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+
+    def load(self, key: str) -> pd.DataFrame | None:
+        """Return the cached dataset, or None if it is not cached
+
+        Args:
+            key (str): key of the dataset
+
+        Returns:
+            pd.DataFrame | None: dataset with memory-mapped columns
+        """
+        path = os.path.join(self.cache_dir, key)
+        try:
+            with open(os.path.join(path, "columns.json"), encoding="utf-8") as f:
+                columns = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        # Mark the entry as recently used
+        os.utime(path)
+        arrays = {
+            column: np.load(os.path.join(path, f"{i}.npy"), mmap_mode="r")
+            for i, column in enumerate(columns)
+        }
+        return pd.DataFrame(arrays, copy=False)
+
+    def save(self, key: str, dataset: pd.DataFrame) -> bool:
+        """Store the dataset, if all of its columns have a numeric or bool dtype
+
+        Args:
+            key (str): key of the dataset
+            dataset (pd.DataFrame): dataset to store
+
+        Returns:
+            bool: whether the dataset was stored
+        """
+        if any(dtype == object for dtype in dataset.dtypes):
+            return False
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, key)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        os.makedirs(tmp_path)
+        for i, column in enumerate(dataset.columns):
+            np.save(os.path.join(tmp_path, f"{i}.npy"), dataset[column].to_numpy())
+        with open(os.path.join(tmp_path, "columns.json"), "w", encoding="utf-8") as f:
+            json.dump(list(dataset.columns), f)
+
+        # Publish the entry at once: readers never see a partial dataset
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Stored meanwhile by another run
+            shutil.rmtree(tmp_path)
+        self.prune()
+        return True
+
+    def prune(self) -> None:
+        """Remove the least recently used entries above max_entries"""
+        # Skip the entries being written by other runs
+        entries = sorted(
+            (
+                os.path.join(self.cache_dir, name)
+                for name in os.listdir(self.cache_dir)
+                if ".tmp" not in name
+            ),
+            key=os.path.getmtime,
+            reverse=True,
+        )
+        for path in entries[self.max_entries :]:
+            shutil.rmtree(path, ignore_errors=True)
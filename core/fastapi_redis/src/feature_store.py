@@ -0,0 +1,209 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+import numpy as np
+import redis
+import redis.asyncio
+
+from serialization import DualReadCodec, PackedCodec, PickleCodec
+
+# Prefix of the Redis keys of the raw venue features. The keys of the older
+# servers, the bare venue ids, hold features normalized at import: they are
+# never read, so that the venues are not normalized twice
+VENUE_KEY_PREFIX = "venue_raw:"
+# Redis key holding the version of the venue data, updated on every import
+VERSION_KEY = "venue_raw_data_version"
+# Redis key holding the set of imported venue ids
+VENUE_IDS_KEY = "venue_raw_ids"
+
+
+def venue_key(venue_id: int | str) -> str:
+    """Return the Redis key of the raw features of the venue"""
+    return VENUE_KEY_PREFIX + str(venue_id)
+
+
+def read_venue_table(
+    client: redis.Redis,
+    codec: PickleCodec | PackedCodec | DualReadCodec,
+    n_features: int,
+) -> tuple[np.ndarray, np.ndarray, bytes | None]:
+    """Read the whole venue table from Redis, sorted by venue id
+
+    Args:
+        client (redis.Redis): Redis client
+        codec (PickleCodec | PackedCodec | DualReadCodec): venue codec
+        n_features (int): number of venue features
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, bytes | None]: sorted venue ids, raw
+            venue features in the same order, and version of the venue data
+    """
+    # Read the version first: if the data changes while reading,
+    # the next refresh sees a newer version and reads again
+    version = client.get(VERSION_KEY)
+    venue_ids = sorted(int(venue_id) for venue_id in client.smembers(VENUE_IDS_KEY))
+
+    pipe = client.pipeline(transaction=False)
+    for venue_id in venue_ids:
+        pipe.get(venue_key(venue_id))
+    blobs = pipe.execute()
+    # Skip venues deleted between SMEMBERS and GET
+    pairs = [
+        (venue_id, data) for venue_id, data in zip(venue_ids, blobs) if data is not None
+    ]
+
+    matrix = np.empty((len(pairs), n_features))
+    codec.decode_into([data for _, data in pairs], matrix)
+    return (
+        np.array([venue_id for venue_id, _ in pairs], dtype=np.int64),
+        matrix,
+        version,
+    )
+
+
+class VenueFeatureStore:
+    """In-process copy of the venue features, with Redis as the source of truth.
+
+    The features are kept in one contiguous NumPy matrix plus a
+    venue_id -> row index map. The version key in Redis is checked at most
+    once per `ttl` seconds, and the whole table is reloaded when it changes,
+    with the blocking `sync_client` in a thread.
+    """
+
+    def __init__(
+        self,
+        client: redis.asyncio.Redis,
+        sync_client: redis.Redis,
+        codec: PickleCodec | PackedCodec | DualReadCodec,
+        n_features: int,
+        ttl: float = 30.0,
+    ):
+        self.r = client
+        self.sync_client = sync_client
+        self.codec = codec
+        self.ttl = ttl
+        self.matrix: np.ndarray = np.empty((0, n_features))
+        self.index: dict[int, int] = {}
+        self.version: bytes | None = None
+        self.checked_at: float = 0.0
+        # Counters
+        self.hits: int = 0
+        self.misses: int = 0
+        self.reloads: int = 0
+
+    async def load(self) -> None:
+        """Load the whole venue table from Redis"""
+        # Decoding the table takes a while, keep it off the event loop
+        venue_ids, matrix, version = await asyncio.to_thread(
+            read_venue_table, self.sync_client, self.codec, self.matrix.shape[1]
+        )
+        # Swap both references at once, readers never see a half-built table
+        self.matrix, self.index = matrix, {
+            venue_id: i for i, venue_id in enumerate(venue_ids.tolist())
+        }
+        self.version = version
+        self.checked_at = time.monotonic()
+        self.reloads += 1
+
+    async def refresh(self) -> None:
+        """Reload the table if the TTL expired and the version in Redis changed"""
+        if time.monotonic() - self.checked_at < self.ttl:
+            return
+        # Set before awaiting, so concurrent requests don't check again
+        self.checked_at = time.monotonic()
+        if await self.r.get(VERSION_KEY) != self.version:
+            await self.load()
+
+    async def get_features(self, venue_ids: list, out: np.ndarray) -> list[int]:
+        """Given the list of venue ids, write the features of the venues of the
+        local table into the given array
+
+        Args:
+            venue_ids (list): list of venue ids
+            out (np.ndarray): array of shape (len(venue_ids), n_features)
+
+        Returns:
+            list[int]: positions of the venue ids missing from the local table,
+                to be fetched from Redis; their rows of `out` are left untouched
+        """
+        await self.refresh()
+
+        matrix, index = self.matrix, self.index
+        rows = [index.get(venue_id, -1) for venue_id in venue_ids]
+        missing = [i for i, row in enumerate(rows) if row < 0]
+
+        self.hits += len(rows) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            found = [i for i, row in enumerate(rows) if row >= 0]
+            out[found] = matrix[[rows[i] for i in found]]
+        else:
+            out[:] = matrix[rows]
+        return missing
+
+    def stats(self) -> dict:
+        """Return the counters of the store"""
+        total = self.hits + self.misses
+        return {
+            "version": self.version.decode() if self.version else None,
+            "venues": len(self.index),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "reloads": self.reloads,
+        }
+
+
+class NegativeCache:
+    """Venue ids recently found missing from Redis, so that repeated unknown
+    ids are answered without a Redis round-trip.
+
+    Entries expire after `ttl` seconds, so that venues imported meanwhile are
+    found again; beyond `max_size` entries, the oldest ones are evicted.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        # venue_id -> expiry time, oldest first
+        self.entries: OrderedDict[int, float] = OrderedDict()
+        # Counters
+        self.hits: int = 0
+        self.insertions: int = 0
+
+    def lookup(self, venue_ids: list) -> list[int]:
+        """Return the positions of the venue ids known to be missing"""
+        if not self.entries:
+            return []
+        now = time.monotonic()
+        positions = []
+        for i, venue_id in enumerate(venue_ids):
+            expiry = self.entries.get(venue_id)
+            if expiry is None:
+                continue
+            if expiry > now:
+                positions.append(i)
+            else:
+                self.entries.pop(venue_id, None)
+        self.hits += len(positions)
+        return positions
+
+    def add(self, venue_ids: list) -> None:
+        """Remember the venue ids found missing from Redis"""
+        expiry = time.monotonic() + self.ttl
+        for venue_id in venue_ids:
+            self.entries[venue_id] = expiry
+            self.entries.move_to_end(venue_id)
+        self.insertions += len(venue_ids)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Return the counters of the cache"""
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "insertions": self.insertions,
+        }
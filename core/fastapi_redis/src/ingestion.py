@@ -0,0 +1,231 @@
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+import pandas as pd
+import redis
+
+from data import venue_data_cleaning
+from feature_store import VENUE_IDS_KEY, VERSION_KEY, venue_key
+from serialization import DualReadCodec, PackedCodec, PickleCodec, get_codec
+
+# Redis hash holding the content hash of each imported venue
+VENUE_HASHES_KEY = "venue_raw_hashes"
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        description="Import the venue data into Redis, writing only the changes"
+    )
+    parser.add_argument(
+        "--data-path",
+        default=os.getenv("VENUE_DATA_PATH", "data/venues.csv"),
+        help="Full venue table: venues missing from it are deleted from Redis, "
+        "unless --partial.",
+    )
+    parser.add_argument(
+        "--partial",
+        action="store_true",
+        help="The file holds only new or changed venues: the others are kept.",
+    )
+    parser.add_argument(
+        "--delete",
+        nargs="+",
+        default=[],
+        metavar="VENUE_ID",
+        help="Venues to delete, implies --partial. Use --data-path '' to only "
+        "delete venues.",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=1000, help="Venues per Redis pipeline."
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Compare every venue, even if the version in Redis matches.",
+    )
+    return parser.parse_args(argv)
+
+
+def read_venue_data(data_path: str) -> pd.DataFrame:
+    """Read the raw venue data. It is imputed & scaled at serving time,
+    with the statistics of the active model, see VenueNormalizer
+
+    Args:
+        data_path (str): path of the venue data file
+
+    Returns:
+        pd.DataFrame: venue_id column followed by the raw venue features
+    """
+    return venue_data_cleaning(pd.read_csv(data_path))
+
+
+def encode_venues(
+    venue_df: pd.DataFrame, codec: PickleCodec | PackedCodec | DualReadCodec
+) -> dict[str, bytes]:
+    """Serialize the features of each venue
+
+    Args:
+        venue_df (pd.DataFrame): venue_id column followed by the venue features
+        codec (PickleCodec | PackedCodec | DualReadCodec): venue codec
+
+    Returns:
+        dict[str, bytes]: venue_id -> serialized features
+    """
+    keys = venue_df.venue_id.values.tolist()
+    values = venue_df.iloc[:, 1:].values.tolist()
+    return {str(key): codec.encode(value) for key, value in zip(keys, values)}
+
+
+def content_hash(value: bytes) -> str:
+    """Hash of the serialized features of a venue"""
+    return hashlib.blake2b(value, digest_size=16).hexdigest()
+
+
+def dataset_version(hashes: dict[str, str]) -> str:
+    """Version of the venue data: hash of the content hash of every venue,
+    independent of the order of the venues
+
+    Args:
+        hashes (dict[str, str]): venue_id -> content hash
+
+    Returns:
+        str: version of the venue data
+    """
+    version = hashlib.sha1()
+    for key in sorted(hashes):
+        version.update(f"{key}:{hashes[key]}\n".encode())
+    return version.hexdigest()
+
+
+def chunks(items: list, size: int):
+    """Split the list into consecutive chunks of the given size"""
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def ingest_venues(
+    client: redis.Redis,
+    venues: dict[str, bytes],
+    chunk_size: int = 1000,
+    force: bool = False,
+    partial: bool = False,
+    delete_ids: list[str] | None = None,
+) -> dict:
+    """Write the venues into Redis, writing only the changes: new or changed
+    venues are set, venues missing from `venues` are deleted. In partial mode,
+    the other venues are kept and only the venues of `delete_ids` are deleted.
+
+    Each chunk of changes is applied in one transaction together with the
+    content hashes and the set of venue ids. The version key is removed before
+    the first change and set after the last one, so that an interrupted import
+    never leaves a version matching partially written data.
+
+    Args:
+        client (redis.Redis): Redis client
+        venues (dict[str, bytes]): venue_id -> serialized features, of all venues
+            or, in partial mode, of the new or changed venues
+        chunk_size (int): venues per pipeline
+        force (bool): compare every venue even if the version in Redis matches
+        partial (bool): keep the venues missing from `venues`
+        delete_ids (list[str] | None): venues to delete in partial mode
+
+    Returns:
+        dict: version of the venue data and counts of written, deleted and
+            unchanged venues; skipped is True if the version already matched
+    """
+    hashes = {key: content_hash(value) for key, value in venues.items()}
+    if not partial:
+        # The version of a full table is known before reading Redis
+        version = dataset_version(hashes)
+        stored_version = client.get(VERSION_KEY)
+        if not force and stored_version == version.encode():
+            return {
+                "version": version,
+                "written": 0,
+                "deleted": 0,
+                "unchanged": len(venues),
+                "skipped": True,
+            }
+
+    stored_hashes = {
+        key.decode(): value.decode()
+        for key, value in client.hgetall(VENUE_HASHES_KEY).items()
+    }
+    # Venues imported before the content hashes were stored have no hash
+    stored_ids = {key.decode() for key in client.smembers(VENUE_IDS_KEY)}
+    stored_ids.update(stored_hashes)
+
+    if partial:
+        deleted = sorted(stored_ids.intersection(delete_ids or []))
+        final_hashes = {**stored_hashes, **hashes}
+        for key in deleted:
+            final_hashes.pop(key, None)
+        version = dataset_version(final_hashes)
+    else:
+        deleted = sorted(stored_ids - venues.keys())
+    changed = [key for key in venues if stored_hashes.get(key) != hashes[key]]
+
+    if changed or deleted:
+        client.delete(VERSION_KEY)
+    for chunk in chunks(changed, chunk_size):
+        pipe = client.pipeline()
+        pipe.mset({venue_key(key): venues[key] for key in chunk})
+        pipe.hset(VENUE_HASHES_KEY, mapping={key: hashes[key] for key in chunk})
+        pipe.sadd(VENUE_IDS_KEY, *chunk)
+        pipe.execute()
+    for chunk in chunks(deleted, chunk_size):
+        pipe = client.pipeline()
+        pipe.delete(*[venue_key(key) for key in chunk])
+        pipe.hdel(VENUE_HASHES_KEY, *chunk)
+        pipe.srem(VENUE_IDS_KEY, *chunk)
+        pipe.execute()
+    client.set(VERSION_KEY, version)
+    return {
+        "version": version,
+        "written": len(changed),
+        "deleted": len(deleted),
+        "unchanged": len(venues) - len(changed),
+        "skipped": False,
+    }
+
+
+def main(args):
+    start = time.perf_counter()
+    partial = args.partial or bool(args.delete)
+    venues = {}
+    if args.data_path:
+        venue_df = read_venue_data(args.data_path)
+        codec = get_codec(
+            os.getenv("VENUE_ENCODING", "float64"),
+            venue_df.shape[1] - 1,
+            os.getenv("VENUE_DUAL_READ", "false").lower() == "true",
+        )
+        venues = encode_venues(venue_df, codec)
+    elif not partial:
+        sys.exit("--data-path is required, except with --partial or --delete")
+
+    client = redis.Redis(
+        host=os.getenv("REDIS_HOST"),
+        port=os.getenv("REDIS_PORT"),
+        password=os.getenv("REDIS_PASSWORD"),
+        decode_responses=False,
+    )
+    stats = ingest_venues(
+        client, venues, args.chunk_size, args.force, partial, args.delete
+    )
+    elapsed = time.perf_counter() - start
+    if stats["skipped"]:
+        print(f"Version {stats['version']} already in Redis, nothing to do")
+    else:
+        print(
+            f"Version {stats['version']}: {stats['written']} venues written, "
+            f"{stats['deleted']} deleted, {stats['unchanged']} unchanged"
+        )
+    print(f"Done in {elapsed:.3f}s")
+
+
+if __name__ == "__main__":
+    main(parse_arguments(sys.argv[1:]))
@@ -0,0 +1,377 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Stages reported by the load test, in the order of the request path
+STAGES = ["decode", "result_cache", "redis_fetch", "merge", "score", "encode", "total"]
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        description="Measure the throughput of /prediction/ under concurrency and "
+        "its latency stage by stage"
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["http", "inprocess"],
+        default="http",
+        help="http: send requests to a server, "
+        "inprocess: call the route function directly.",
+    )
+    parser.add_argument(
+        "--url",
+        default=None,
+        help="URL of /prediction/ of a running server, started with "
+        "SERVER_TIMING=true for the stages. By default the http mode starts the "
+        "app locally.",
+    )
+    parser.add_argument(
+        "--fake-redis",
+        action="store_true",
+        help="Serve the app from an in-memory Redis (requires fakeredis).",
+    )
+    parser.add_argument("--data-path", default="data/venues.csv")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        nargs="+",
+        default=[1, 8, 32, 64],
+        help="Numbers of concurrent clients to test.",
+    )
+    parser.add_argument(
+        "--requests", type=int, default=500, help="Requests per concurrency level."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10, 50, 200],
+        help="Numbers of venues per request, picked at random for each request.",
+    )
+    parser.add_argument(
+        "--unknown-ratio",
+        type=float,
+        default=0.0,
+        help="Fraction of venue ids of a request that are not in the venue data.",
+    )
+    parser.add_argument(
+        "--unknown-pool",
+        type=int,
+        default=0,
+        help="Draw the unknown venue ids from this many ids, e.g. repeated junk "
+        "ids of a misbehaving client. By default every unknown id is new.",
+    )
+    parser.add_argument(
+        "--distinct",
+        type=int,
+        default=0,
+        help="Cycle through this many distinct payloads, e.g. to measure the "
+        "result cache. By default every payload is new.",
+    )
+    parser.add_argument(
+        "--max-p99-ms",
+        type=float,
+        default=None,
+        help="Exit with an error if the total p99 latency of a concurrency level "
+        "exceeds this value.",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+
+def free_port() -> int:
+    """Return a free local TCP port"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_redis() -> None:
+    """Serve an in-memory Redis in a background thread and point the app to it"""
+    try:
+        from fakeredis import TcpFakeServer
+    except ImportError:
+        sys.exit("--fake-redis requires fakeredis: pip install fakeredis")
+
+    port = free_port()
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    # Do not wait for the open client connections at exit
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ.update(REDIS_HOST="127.0.0.1", REDIS_PORT=str(port))
+    os.environ.pop("REDIS_PASSWORD", None)
+
+
+def make_payloads(
+    venue_ids: list[int],
+    n_requests: int,
+    sizes: list[int],
+    unknown_ratio: float,
+    seed: int,
+    unknown_pool: int = 0,
+) -> list[bytes]:
+    """Build realistic /prediction/ bodies from the venue ids of the venue data
+
+    Args:
+        venue_ids (list[int]): known venue ids
+        n_requests (int): number of requests
+        sizes (list[int]): numbers of venues per request
+        unknown_ratio (float): fraction of unknown venue ids per request
+        seed (int): random seed
+        unknown_pool (int): number of distinct unknown venue ids, 0 for a new
+            unknown id each time
+
+    Returns:
+        list[bytes]: JSON bodies of the requests
+    """
+    rng = np.random.default_rng(seed)
+    known = set(venue_ids)
+    # Random ids are unknown with overwhelming probability
+    pool = [
+        venue_id
+        for venue_id in rng.integers(-(2**63), 2**63 - 1, unknown_pool).tolist()
+        if venue_id not in known
+    ]
+    payloads = []
+    for _ in range(n_requests):
+        size = min(int(rng.choice(sizes)), len(venue_ids))
+        ids = rng.choice(venue_ids, size, replace=False).tolist()
+        for i in np.flatnonzero(rng.random(size) < unknown_ratio):
+            if pool:
+                ids[i] = pool[int(rng.integers(len(pool)))]
+            while ids[i] in known:
+                ids[i] = int(rng.integers(-(2**63), 2**63 - 1))
+        flags = rng.random((size, 3)) < (0.3, 0.2, 0.4)
+        payloads.append(
+            json.dumps(
+                {
+                    "data": [
+                        {
+                            "venue_id": venue_id,
+                            "is_new_user": bool(new_user),
+                            "is_from_order_again": bool(order_again),
+                            "is_recommended": bool(recommended),
+                        }
+                        for venue_id, (new_user, order_again, recommended) in zip(
+                            ids, flags
+                        )
+                    ]
+                }
+            ).encode("utf-8")
+        )
+    return payloads
+
+
+async def run_inprocess(payloads: list[bytes], concurrency: int) -> list[dict]:
+    """Call the route function directly, timing the decoding as FastAPI would.
+    The app must be started, see start_inprocess
+
+    Args:
+        payloads (list[bytes]): JSON bodies of the requests
+        concurrency (int): number of concurrent requests
+
+    Returns:
+        list[dict]: stage durations of each request, None for failed requests
+    """
+    import main
+    from timing import start_request
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_request(payload: bytes) -> dict | None:
+        async with semaphore:
+            stages = start_request()
+            start = time.perf_counter()
+            try:
+                decode_start = time.perf_counter()
+                data = main.InputData.model_validate_json(payload)
+                stages["decode"] = time.perf_counter() - decode_start
+
+                # The route encodes the response body itself
+                await main.prediction(data)
+            except Exception:
+                return None
+            stages["total"] = time.perf_counter() - start
+            return stages
+
+    # Run each request in its own task, so that each has its own stages
+    return await asyncio.gather(
+        *(asyncio.create_task(one_request(payload)) for payload in payloads)
+    )
+
+
+def start_inprocess(loop: asyncio.AbstractEventLoop) -> None:
+    """Start the app in the event loop running the requests"""
+    import main
+
+    loop.run_until_complete(main.startup())
+    # With STARTUP_MODE=background, startup returns before the warm-up is done
+    while not main.warm_up_state["ready"]:
+        check_warm_up_error(main.warm_up_state)
+        loop.run_until_complete(asyncio.sleep(0.05))
+
+
+def check_warm_up_error(warm_up_state: dict) -> None:
+    """Stop the load test if the warm-up of the app failed"""
+    if warm_up_state["error"] is not None:
+        raise RuntimeError(f"Warm-up failed: {warm_up_state['error']}")
+
+
+def start_local_server() -> str:
+    """Start the app in a local uvicorn server and return its /prediction/ URL"""
+    os.environ["SERVER_TIMING"] = "true"
+    import uvicorn
+
+    import main
+
+    port = free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    # The server answers before the warm-up is done with STARTUP_MODE=background
+    while not main.warm_up_state["ready"]:
+        check_warm_up_error(main.warm_up_state)
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/prediction/"
+
+
+def send_request(url: str, payload: bytes) -> dict | None:
+    """Send one request and read the stage durations of its Server-Timing header
+
+    Returns:
+        dict | None: stage durations of the request, None if it failed
+    """
+    request = urllib.request.Request(
+        url, data=payload, headers={"Content-Type": "application/json"}
+    )
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            server_timing = response.headers.get("Server-Timing", "")
+    except urllib.error.URLError:
+        return None
+    total = time.perf_counter() - start
+
+    stages = {}
+    for entry in filter(None, server_timing.split(",")):
+        name, _, duration = entry.strip().partition(";dur=")
+        stages[name] = float(duration) / 1000
+    if "total" in stages:
+        # The rest of the server time is spent by FastAPI,
+        # mostly decoding the request and encoding the response
+        server_total = stages.pop("total")
+        stages["decode"] = server_total - sum(stages.values())
+    stages["total"] = total
+    return stages
+
+
+def run_http(url: str, payloads: list[bytes], concurrency: int) -> list[dict]:
+    """Send the requests with the given number of concurrent clients"""
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(lambda payload: send_request(url, payload), payloads))
+
+
+def report(results: list[dict | None], elapsed: float) -> pd.DataFrame:
+    """Summarize the stage durations of the requests, in milliseconds"""
+    succeeded = [stages for stages in results if stages is not None]
+    rows = []
+    for name in STAGES:
+        durations = [stages[name] * 1000 for stages in succeeded if name in stages]
+        if durations:
+            rows.append(
+                {
+                    "stage": name,
+                    "mean (ms)": np.mean(durations),
+                    "p50 (ms)": np.percentile(durations, 50),
+                    "p95 (ms)": np.percentile(durations, 95),
+                    "p99 (ms)": np.percentile(durations, 99),
+                }
+            )
+    print(
+        f"requests: {len(results)}, errors: {len(results) - len(succeeded)}, "
+        f"throughput: {len(results) / elapsed:.1f} requests/s"
+    )
+    summary = pd.DataFrame(rows)
+    print(summary.to_string(index=False, float_format="%.3f"))
+    return summary
+
+
+def main(args):
+    if args.fake_redis:
+        start_fake_redis()
+
+    venue_ids = pd.read_csv(args.data_path).venue_id.values.tolist()
+    payloads = make_payloads(
+        venue_ids,
+        args.requests,
+        args.sizes,
+        args.unknown_ratio,
+        args.seed,
+        args.unknown_pool,
+    )
+    if args.distinct:
+        payloads = [payloads[i % args.distinct] for i in range(len(payloads))]
+
+    if args.mode == "http":
+        url = args.url or start_local_server()
+        # Warm up the server and its connection pool
+        run_http(url, payloads[:20], 4)
+
+        def run(concurrency: int) -> list[dict]:
+            return run_http(url, payloads, concurrency)
+
+    else:
+        # The app is bound to the event loop it starts in: run every level in it
+        loop = asyncio.new_event_loop()
+        start_inprocess(loop)
+
+        def run(concurrency: int) -> list[dict]:
+            return loop.run_until_complete(run_inprocess(payloads, concurrency))
+
+    levels = []
+    for concurrency in args.concurrency:
+        start = time.perf_counter()
+        results = run(concurrency)
+        elapsed = time.perf_counter() - start
+
+        print(f"\nconcurrency: {concurrency}")
+        summary = report(results, elapsed)
+        if summary.empty:
+            sys.exit("All requests failed")
+        total = summary.set_index("stage").loc["total"]
+        levels.append(
+            {
+                "concurrency": concurrency,
+                "requests/s": len(results) / elapsed,
+                "p50 (ms)": total["p50 (ms)"],
+                "p95 (ms)": total["p95 (ms)"],
+                "p99 (ms)": total["p99 (ms)"],
+            }
+        )
+
+    print()
+    levels = pd.DataFrame(levels)
+    print(levels.to_string(index=False, float_format="%.1f"))
+    if args.max_p99_ms is not None:
+        p99 = levels["p99 (ms)"].max()
+        if p99 > args.max_p99_ms:
+            sys.exit(f"p99 latency {p99:.3f}ms exceeds {args.max_p99_ms}ms")
+
+
+if __name__ == "__main__":
+    main(parse_arguments(sys.argv[1:]))
@@ -1,17 +1,52 @@
-import json
+import asyncio
+import contextvars
 import os
-import pickle
+import secrets
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import TYPE_CHECKING
 
-import pandas as pd
+import numpy as np
+import pydantic_core
 import redis
-import uvicorn
-from fastapi import FastAPI, status
+import redis.asyncio
+from fastapi import FastAPI, Header, HTTPException, Request, status
 from fastapi.encoders import jsonable_encoder
-from pydantic import BaseModel
-from pydantic.tools import parse_obj_as
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from pydantic import BaseModel, Field
 
-from data import venue_data_preprocessing
-from model import Model
+from batching import MicroBatcher
+from connection_pool import CountingConnectionPool
+from feature_store import VERSION_KEY, NegativeCache, VenueFeatureStore, venue_key
+from metrics import (
+    Counter,
+    Histogram,
+    Profiler,
+    component_metrics,
+    model_metrics,
+    redis_pool_metrics,
+)
+from ranking import ranking_order
+from registry import ModelRegistry
+from result_cache import ResultCache
+from serialization import get_codec
+from shared_tables import SharedVenueTables
+from timing import stage, start_request
+
+if TYPE_CHECKING:
+    # Imported on first use: pandas and scikit-learn are slow to import, and
+    # only the legacy scoring path, the venue import and the models need them
+    import pandas as pd
+
+    from model import Model
+
+user_data_columns = [
+    "is_new_user",
+    "is_from_order_again",
+    "is_recommended",
+]
 
 venue_data_columns = [
     "conversions_per_impression",
@@ -21,9 +56,75 @@ venue_data_columns = [
     "retention_rate",
 ]
 
+# Score requests with the pure-NumPy path instead of pandas + predict_proba
+fast_scoring = os.getenv("FAST_SCORING", "false").lower() == "true"
+# Dtype of the feature matrix used by the fast scoring path
+scoring_dtype = np.dtype(os.getenv("SCORING_DTYPE", "float64"))
+# Serialization format of the venue features in Redis
+venue_encoding = os.getenv("VENUE_ENCODING", "float64")
+# Also read venues stored in the pickle format, when migrating from it
+venue_dual_read = os.getenv("VENUE_DUAL_READ", "false").lower() == "true"
+# Keep an in-process copy of the venue features, refreshed from Redis
+use_feature_store = os.getenv("FEATURE_STORE", "false").lower() == "true"
+# Directory of the venue table shared by the workers, set by prefork.py
+shared_tables_dir = os.getenv("SHARED_TABLES_DIR") or None
+# Seconds between two checks of the venue data version in Redis
+feature_store_ttl = float(os.getenv("FEATURE_STORE_TTL", "30"))
+# Venues missing from the venue data: "default" scores them with the default
+# features of the model, "drop" leaves them out of the response
+missing_venue_policy = os.getenv("MISSING_VENUE_POLICY", "default")
+# Unknown venue ids remembered to skip Redis, 0 disables the negative cache
+negative_cache_size = int(os.getenv("NEGATIVE_CACHE_SIZE", "10000"))
+# Seconds an unknown venue id is remembered
+negative_cache_ttl = float(os.getenv("NEGATIVE_CACHE_TTL", "60"))
+# Cache the responses of repeated requests
+use_result_cache = os.getenv("RESULT_CACHE", "false").lower() == "true"
+# Memory bound of the in-process result cache, in MB
+result_cache_max_mb = float(os.getenv("RESULT_CACHE_MAX_MB", "64"))
+# Seconds a response is cached
+result_cache_ttl = float(os.getenv("RESULT_CACHE_TTL", "10"))
+# Also share the cached responses between the server processes through Redis
+result_cache_redis = os.getenv("RESULT_CACHE_REDIS", "false").lower() == "true"
+# Maximum number of connections of the async Redis connection pool
+redis_max_connections = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+# Seconds to wait for a free connection of the pool
+redis_pool_timeout = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+# Seconds to wait for connecting to Redis and for each Redis reply
+redis_connect_timeout = float(os.getenv("REDIS_CONNECT_TIMEOUT", "5"))
+redis_socket_timeout = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+# Number of threads running the CPU-bound scoring off the event loop
+scoring_threads = int(os.getenv("SCORING_THREADS", str(min(4, os.cpu_count() or 1))))
+# Coalesce concurrent requests and score them in one vectorized call
+use_batching = os.getenv("BATCHING", "false").lower() == "true"
+# A batch is scored once it has this many rows...
+batch_max_size = int(os.getenv("BATCH_MAX_SIZE", "512"))
+# ...or this many milliseconds after its first request arrived
+batch_max_wait_ms = float(os.getenv("BATCH_MAX_WAIT_MS", "2"))
+# "eager": warm up before accepting requests, "background": accept requests at
+# once and warm up in the background, /readiness tells when it is done
+startup_mode = os.getenv("STARTUP_MODE", "eager")
+# Venue data imported into Redis at startup
+venue_data_path = os.getenv("VENUE_DATA_PATH", "data/venues.csv")
+# Disable when the venue data is imported with ingestion.py instead
+ingest_on_startup = os.getenv("INGEST_ON_STARTUP", "true").lower() == "true"
+# Model artifact directory of the active model at startup
+model_directory = os.getenv("MODEL_DIRECTORY")
+# Models to preload besides the active one: comma-separated directories or "all"
+preload_models = [m for m in os.getenv("PRELOAD_MODELS", "").split(",") if m]
+# Memory-map the arrays of the model artifacts, e.g. "r"
+model_mmap_mode = os.getenv("MODEL_MMAP_MODE") or None
+# Report the duration of each stage of a request in a Server-Timing header
+server_timing = os.getenv("SERVER_TIMING", "false").lower() == "true"
+# Fraction of the requests whose stage breakdown is dumped on stdout
+profile_sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Validate the responses against OutputData before sending them
+validate_output = os.getenv("VALIDATE_OUTPUT", "true").lower() == "true"
+# Token the admin routes require in the X-Admin-Token header, unset disables them
+admin_token = os.getenv("ADMIN_TOKEN")
+
 app = FastAPI()
 
-# Create the connection to Redis cache
+# Create the connection to Redis cache, used for importing the venue data
 r = redis.Redis(
     host=os.getenv("REDIS_HOST"),
     port=os.getenv("REDIS_PORT"),
@@ -31,59 +132,253 @@ r = redis.Redis(
     decode_responses=False,
 )
 
+# Create the async connection pool to Redis cache, used for serving requests
+ar = redis.asyncio.Redis(
+    connection_pool=CountingConnectionPool(
+        host=os.getenv("REDIS_HOST"),
+        port=os.getenv("REDIS_PORT"),
+        password=os.getenv("REDIS_PASSWORD"),
+        max_connections=redis_max_connections,
+        timeout=redis_pool_timeout,
+        socket_connect_timeout=redis_connect_timeout,
+        socket_timeout=redis_socket_timeout,
+    )
+)
 
-def import_data_to_redis(data_path: str) -> None:
-    """
-       Put the venue data into Redis cache
-       into the following key-value format:
-        Key: venue_id(str)
-        Values: a list with columns:
-            ['conversions_per_impression', 'price_range',
-            'rating', 'popularity', 'retention_rate']
+# Bounded thread pool for the CPU-bound pandas/sklearn/NumPy work
+scoring_executor = ThreadPoolExecutor(
+    max_workers=scoring_threads, thread_name_prefix="scoring"
+)
 
-    Args:
-        data_path (str): path of the venue data file
-    """
+codec = get_codec(venue_encoding, len(venue_data_columns), venue_dual_read)
 
-    # Read csv data as DataFrame
-    venue_df = pd.read_csv(data_path)
-    venue_df = venue_data_preprocessing(venue_df)
+if missing_venue_policy not in ("default", "drop"):
+    raise ValueError(f"Unknown missing venue policy: {missing_venue_policy}")
 
-    # Use venue_id as key
-    keys = venue_df.venue_id.values.tolist()
-    # The rest columns as values
-    values = venue_df.iloc[:, 1:].values.tolist()
-    # Convert into key:value pairs & serialize the list
-    data = {str(key): pickle.dumps(value) for key, value in zip(keys, values)}
-    # Set the key:value pairs into Redis
-    assert r.mset(data)
+# Venue ids recently found missing from Redis
+negative_cache = None
+if negative_cache_size > 0:
+    negative_cache = NegativeCache(negative_cache_size, negative_cache_ttl)
+
+# Metrics exported in the Prometheus text format by /metrics
+request_count = Counter(
+    "http_requests_total", "Number of HTTP requests.", ("handler", "status")
+)
+request_latency = Histogram(
+    "http_request_duration_seconds", "Latency of the HTTP requests.", ("handler",)
+)
+stage_latency = Histogram(
+    "prediction_stage_duration_seconds",
+    "Duration of each stage of the predictions, per request or per batch.",
+    ("stage",),
+)
+profiler = Profiler(profile_sample_rate)
 
 
-def get_data_from_redis(venue_ids: list) -> pd.DataFrame:
+async def get_data_from_redis(
+    venue_ids: list,
+) -> tuple["pd.DataFrame", np.ndarray]:
     """Given the list of venue ids, Get the venue data from Redis.
 
     Args:
         venue_ids (list): list of venue ids
 
     Returns:
-        pd.DataFrame: venue data
+        tuple[pd.DataFrame, np.ndarray]: raw venue data, before imputation &
+            scaling, one row per venue id; and mask of the venues found
     """
-    pipe = r.pipeline()
-    for venue_id in venue_ids:
-        pipe.get(str(venue_id))
+    import pandas as pd
 
-    data_lists = [pickle.loads(data) for data in pipe.execute()]
-    df = pd.DataFrame(data_lists, columns=venue_data_columns)
+    features = np.empty((len(venue_ids), len(venue_data_columns)))
+    valid = await get_features_from_redis(venue_ids, features)
+    df = pd.DataFrame(features, columns=venue_data_columns)
     df["venue_id"] = venue_ids
-    return df
+    return df, valid
+
+
+async def get_features_from_redis(venue_ids: list, out: np.ndarray) -> np.ndarray:
+    """Given the list of venue ids, write the venue features from Redis
+    into the given array, row by row in the order of venue_ids.
+
+    Args:
+        venue_ids (list): list of venue ids
+        out (np.ndarray): array of shape (len(venue_ids), len(venue_data_columns))
+
+    Returns:
+        np.ndarray: mask of the venues found, the rows of the others are NaN
+    """
+    with stage("redis_fetch"):
+        if feature_store is not None:
+            missing = await feature_store.get_features(venue_ids, out)
+        elif shared_tables is not None:
+            missing = shared_tables.get_features(venue_ids, out)
+        else:
+            return await fetch_features(venue_ids, out)
+
+        valid = np.ones(len(venue_ids), dtype=bool)
+        if missing:
+            # Venues added since the table was loaded, or unknown venues
+            buffer = np.empty((len(missing), out.shape[1]), dtype=out.dtype)
+            valid[missing] = await fetch_features(
+                [venue_ids[i] for i in missing], buffer
+            )
+            out[missing] = buffer
+        return valid
+
+
+async def fetch_features(venue_ids: list, out: np.ndarray) -> np.ndarray:
+    """Fetch the venue features from Redis in one pipeline and decode them
+    into the given array. The venue ids of the negative cache are not fetched,
+    and the venues missing from Redis are added to it.
 
+    Args:
+        venue_ids (list): list of venue ids
+        out (np.ndarray): array of shape (len(venue_ids), len(venue_data_columns))
+
+    Returns:
+        np.ndarray: mask of the venues found, the rows of the others are NaN
+    """
+    valid = np.ones(len(venue_ids), dtype=bool)
+    if negative_cache is not None:
+        valid[negative_cache.lookup(venue_ids)] = False
+    rows = np.flatnonzero(valid).tolist()
+
+    if rows:
+        async with ar.pipeline(transaction=False) as pipe:
+            for i in rows:
+                pipe.get(venue_key(venue_ids[i]))
+            blobs = await pipe.execute()
+
+        found = [row for row, blob in zip(rows, blobs) if blob is not None]
+        if len(found) == len(venue_ids):
+            codec.decode_into(blobs, out)
+            return valid
 
-# Import venue data into Redis cache
-import_data_to_redis("data/venues.csv")
+        if found:
+            buffer = np.empty((len(found), out.shape[1]), dtype=out.dtype)
+            codec.decode_into([blob for blob in blobs if blob is not None], buffer)
+            out[found] = buffer
+        absent = [row for row, blob in zip(rows, blobs) if blob is None]
+        valid[absent] = False
+        if negative_cache is not None:
+            negative_cache.add([venue_ids[i] for i in absent])
 
-# Initialize and load the model
-model = Model()
-model.model_loading(os.getenv("MODEL_DIRECTORY"))
+    out[~valid] = np.nan
+    return valid
+
+
+async def run_in_scoring_pool(func, *args):
+    """Run the CPU-bound function in the scoring thread pool,
+    so that the event loop keeps serving other requests.
+    """
+    loop = asyncio.get_running_loop()
+    # Run in the context of the request, so that its stages are recorded
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(scoring_executor, context.run, func, *args)
+
+
+# Venue table shared by the pre-fork workers, published by prefork.py
+shared_tables = None
+if shared_tables_dir is not None:
+    shared_tables = SharedVenueTables(shared_tables_dir)
+
+# In-process venue feature store, populated from Redis at startup
+feature_store = None
+if use_feature_store and shared_tables is None:
+    feature_store = VenueFeatureStore(
+        ar, r, codec, len(venue_data_columns), feature_store_ttl
+    )
+
+# Cache of the responses, in front of the scoring
+result_cache = None
+if use_result_cache:
+    result_cache = ResultCache(
+        int(result_cache_max_mb * 2**20), result_cache_ttl, ar, result_cache_redis
+    )
+
+# Model registry, the models are loaded at startup
+registry = ModelRegistry(
+    user_data_columns + venue_data_columns,
+    mmap_mode=model_mmap_mode,
+    venue_data_path=venue_data_path,
+)
+
+# Warm-up state reported by /readiness: the duration of each step in seconds
+warm_up_state: dict = {"ready": False, "error": None, "durations": {}}
+warm_up_task: asyncio.Task | None = None
+
+
+def import_venue_data() -> None:
+    """Import venue data into Redis cache, writing only the changed venues:
+    nothing is written if Redis already holds this version of the data
+    """
+    from ingestion import encode_venues, ingest_venues, read_venue_data
+
+    ingest_venues(r, encode_venues(read_venue_data(venue_data_path), codec))
+
+
+def load_models() -> None:
+    """Preload the models of the registry and activate one"""
+    registry.preload(preload_models)
+    registry.activate(model_directory)
+
+
+async def warm_up() -> None:
+    """Import the venue data, load the models and populate the feature store.
+    The blocking steps run in threads, so that the event loop keeps answering
+    /healthcheck and /readiness meanwhile.
+    """
+    durations = warm_up_state["durations"]
+    try:
+        # The workers of the pre-fork server get the venues from the parent
+        if ingest_on_startup and shared_tables is None:
+            start = time.perf_counter()
+            await asyncio.to_thread(import_venue_data)
+            durations["import_venues"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await asyncio.to_thread(load_models)
+        durations["load_models"] = time.perf_counter() - start
+
+        if feature_store is not None:
+            start = time.perf_counter()
+            await feature_store.load()
+            durations["feature_store"] = time.perf_counter() - start
+
+        if shared_tables is not None:
+            start = time.perf_counter()
+            await attach_shared_tables()
+            durations["shared_tables"] = time.perf_counter() - start
+    except Exception as e:
+        warm_up_state["error"] = f"{type(e).__name__}: {e}"
+        if startup_mode != "background":
+            raise
+        traceback.print_exc()
+        return
+    warm_up_state["ready"] = True
+
+
+async def attach_shared_tables() -> None:
+    """Attach the venue table last published by the pre-fork parent, and
+    activate the model it was published with, so that all workers swap the
+    venues and the model together
+    """
+    if shared_tables.refresh():
+        model_directory = shared_tables.metadata["model_directory"]
+        active = registry.active
+        if active is None or active.model_directory != model_directory:
+            # The parent preloaded it before forking, unless it was added since
+            await asyncio.to_thread(registry.activate, model_directory)
+
+
+def check_ready() -> None:
+    """Reject the request until the warm-up is done"""
+    if not warm_up_state["ready"]:
+        raise HTTPException(
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            "Server is warming up",
+            headers={"Retry-After": "1"},
+        )
 
 
 class InputItem(BaseModel):
@@ -112,6 +407,10 @@ class InputData(BaseModel):
     """
 
     data: list[InputItem]
+    # Return the K best venues only
+    top_k: int | None = Field(default=None, ge=1)
+    # Return the venues with a score greater than or equal to this one only
+    score_threshold: float | None = None
 
     class Config:
         arbitrary_types_allowed = True
@@ -125,17 +424,153 @@ class OutputData(BaseModel):
     data: list[OutputItem]
 
 
+@app.middleware("http")
+async def add_server_timing(request: Request, call_next):
+    """Record the stages of each request into the metrics and, if SERVER_TIMING
+    is set, report their durations in milliseconds in the Server-Timing header
+    """
+    stages = start_request()
+    start = time.perf_counter()
+    status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+    try:
+        if shared_tables is not None and warm_up_state["ready"]:
+            # Follow the generation published by the pre-fork parent
+            await attach_shared_tables()
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        total = time.perf_counter() - start
+        # Name of the route function, set by the router; None if no route matched
+        endpoint = request.scope.get("endpoint")
+        handler = endpoint.__name__ if endpoint is not None else "none"
+        observe_request(handler, status_code, total, stages)
+
+    if server_timing:
+        stages["total"] = total
+        response.headers["Server-Timing"] = ", ".join(
+            f"{name};dur={duration * 1000:.3f}" for name, duration in stages.items()
+        )
+    return response
+
+
+def observe_request(
+    handler: str, status_code: int, total: float, stages: dict[str, float]
+) -> None:
+    """Record a request into the metrics, and dump it if sampled by the profiler
+
+    Args:
+        handler (str): name of the route function
+        status_code (int): status code of the response
+        total (float): duration of the request in seconds
+        stages (dict[str, float]): durations of the stages of the request
+    """
+    request_count.inc(handler, str(status_code))
+    request_latency.observe(total, handler)
+    for name, duration in stages.items():
+        stage_latency.observe(duration, name)
+    if profiler.sampled():
+        profiler.dump(handler, status_code, {**stages, "total": total})
+
+
+@app.on_event("startup")
+async def startup():
+    """Warm up before serving requests, or in the background if STARTUP_MODE
+    is "background"
+    """
+    global warm_up_task
+    if startup_mode == "background":
+        warm_up_task = asyncio.create_task(warm_up())
+    else:
+        await warm_up()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Release the Redis connections and the scoring threads"""
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    await ar.close()
+    await ar.connection_pool.disconnect()
+    scoring_executor.shutdown()
+
+
 @app.get("/version/")
 def return_model_version():
-    """Simple route returning the model version
+    """Simple route returning the version of the active model
 
     Returns:
         JSON reponse:
             {
-            'healtcheck': 'Everything OK!'
+            'Model version': '1.0',
+            'Model postfix': '050623_102618',
+            'Loaded at': '2023-06-05T10:30:00'
             }
     """
-    return {"Model version": model.model_version}
+    check_ready()
+    model = registry.active
+    return {
+        "Model version": model.model_version,
+        "Model postfix": model.model_postfix,
+        "Loaded at": datetime.fromtimestamp(model.loaded_at).isoformat(),
+    }
+
+
+def check_admin_token(token: str | None) -> None:
+    """Reject the admin request unless its token matches ADMIN_TOKEN. Without
+    ADMIN_TOKEN, the admin routes are disabled
+    """
+    if not admin_token:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Admin routes are disabled")
+    # Constant-time comparison, so that the token cannot be guessed by timing
+    if token is None or not secrets.compare_digest(
+        token.encode(), admin_token.encode()
+    ):
+        raise HTTPException(status.HTTP_403_FORBIDDEN, "Invalid admin token")
+
+
+@app.get("/admin/models/")
+def list_models(x_admin_token: str | None = Header(default=None)):
+    """Route listing the models of the registry
+
+    Returns:
+        JSON reponse:
+            [
+                {
+                "model_directory": "model_1.0_050623_102618",
+                "loaded": true, "active": true, "metrics": {...}
+                }
+            ]
+    """
+    check_admin_token(x_admin_token)
+    return registry.list_models()
+
+
+@app.post("/admin/models/{model_directory}/activate")
+async def activate_model(
+    model_directory: str, x_admin_token: str | None = Header(default=None)
+):
+    """Route swapping the active model. In-flight requests complete with
+    the model they started with.
+
+    Args:
+        model_directory (str): model artifact directory in the registry
+
+    Returns:
+        JSON reponse: version of the new active model
+    """
+    check_admin_token(x_admin_token)
+    check_ready()
+    try:
+        # Loading reads the artifact from disk: run it off the event loop
+        await run_in_scoring_pool(registry.activate, model_directory)
+    except KeyError as e:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, e.args[0])
+    except ValueError as e:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, str(e))
+    if shared_tables is not None:
+        # The other workers follow once the parent published it
+        shared_tables.request_model(model_directory)
+    return return_model_version()
 
 
 @app.get("/healthcheck", status_code=status.HTTP_200_OK)
@@ -151,15 +586,99 @@ def healthcheck():
     return {"healthcheck": "Everything OK!"}
 
 
-@app.post("/prediction/")
-async def prediction(data: InputData) -> OutputData:
+@app.get("/readiness")
+def readiness():
+    """Route for readiness: unlike /healthcheck, which only tells that the
+    process is alive, it answers 200 only once the warm-up is done, and 503 before
+
+    Returns:
+        JSON reponse:
+            {
+            'ready': True,
+            'error': None,
+            'durations': {'import_venues': 0.02, 'load_models': 0.8, ...}
+            }
+    """
+    status_code = (
+        status.HTTP_200_OK
+        if warm_up_state["ready"]
+        else status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+    return JSONResponse(warm_up_state, status_code)
+
+
+@app.get("/stats/")
+def return_stats():
+    """Route returning the counters of the server components
+
+    Returns:
+        JSON reponse:
+            {
+            'redis_pool': {'max_connections': 50, 'in_use': 2, ...},
+            'feature_store': {'hits': 123, 'misses': 0, ...},
+            'batching': {'batches': 12, 'mean_rows_per_batch': 240.5, ...}
+            }
+    """
+    stats = {"redis_pool": ar.connection_pool.stats()}
+    if feature_store is not None:
+        stats["feature_store"] = feature_store.stats()
+    if shared_tables is not None:
+        stats["shared_tables"] = shared_tables.stats()
+    if negative_cache is not None:
+        stats["negative_cache"] = negative_cache.stats()
+    if result_cache is not None:
+        stats["result_cache"] = result_cache.stats()
+    if batcher is not None:
+        stats["batching"] = batcher.stats()
+    return stats
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def return_metrics():
+    """Route exporting the metrics in the Prometheus text format
+
+    Returns:
+        Text reponse:
+            # HELP http_requests_total Number of HTTP requests.
+            # TYPE http_requests_total counter
+            http_requests_total{handler="prediction",status="200"} 42
+            ...
+    """
+    lines = [
+        *request_count.collect(),
+        *request_latency.collect(),
+        *stage_latency.collect(),
+        *redis_pool_metrics(ar.connection_pool.stats()),
+    ]
+
+    model = registry.active
+    if model is not None:
+        lines += model_metrics(model)
+
+    components = {
+        "feature_store": feature_store,
+        "shared_tables": shared_tables,
+        "negative_cache": negative_cache,
+        "result_cache": result_cache,
+        "batcher": batcher,
+    }
+    for name, component in components.items():
+        if component is not None:
+            lines += component_metrics(name, component.stats())
+
+    return "\n".join(lines) + "\n"
+
+
+# The responses are encoded by the scoring paths: OutputData only documents them
+@app.post("/prediction/", response_model=OutputData)
+async def prediction(data: InputData) -> Response:
     """Route for prediction given the input from request
 
     Args:
         data (InputData): request data consisting a user session
 
     Returns:
-        OutputData: list of venue ids with corresponding scores
+        Response: list of venue ids with corresponding scores
         JSON reponse:
             {
                 "data":
@@ -171,37 +690,387 @@ async def prediction(data: InputData) -> OutputData:
             }
     """
 
-    # input -> json
-    input_json = jsonable_encoder(data)
+    check_ready()
+    if not data.data:
+        # Nothing to score: the scoring paths expect at least one venue
+        return Response(
+            pydantic_core.to_json({"data": []}), media_type="application/json"
+        )
+    # Keep scoring with this model even if the active model is swapped meanwhile
+    model = registry.active
+    if result_cache is None:
+        return await score_request(data, model)
+
+    with stage("result_cache"):
+        version = await venue_data_version()
+        key = None
+        # Without a version, an import is writing the venues: they may mix two
+        # versions
+        if version is not None:
+            # The validated request, encoded by pydantic-core, is canonical
+            request = pydantic_core.to_json(data)
+            key = result_cache.key(request, model.model_directory, version)
+        body = await result_cache.get(key) if key is not None else None
+    if body is not None:
+        return Response(body, media_type="application/json")
+
+    response = await score_request(data, model)
+    # Cache the response only if it was scored with the venue data of its key
+    if key is not None and await venue_data_version(recheck=True) == version:
+        result_cache.put(key, response.body)
+    return response
 
-    # json -> DataFrame
-    df = pd.DataFrame(input_json["data"])
+
+async def venue_data_version(recheck: bool = False) -> bytes | None:
+    """Version of the venue data the requests are scored with
+
+    Args:
+        recheck (bool): read the version in Redis now, instead of the version
+            read by the result cache at most once per check interval
+
+    Returns:
+        bytes | None: version of the venue data, None while an import is
+            writing the venues
+    """
+    if feature_store is not None:
+        if not recheck:
+            await feature_store.refresh()
+        return feature_store.version
+    if shared_tables is not None:
+        return (shared_tables.metadata.get("version") or "").encode() or None
+    if recheck:
+        return await ar.get(VERSION_KEY)
+    return await result_cache.venue_version()
+
+
+async def score_request(data: InputData, model: "Model") -> Response:
+    """Score the request with the scoring path of the configuration
+
+    Args:
+        data (InputData): request data consisting a user session
+        model (Model): model scoring the request
+
+    Returns:
+        Response: list of venue ids with corresponding scores, sorted by score
+    """
+    if batcher is not None:
+        return await batcher.submit((data, model), len(data.data))
+
+    if fast_scoring:
+        return await fast_prediction(data, model)
+
+    import pandas as pd
+
+    with stage("merge"):
+        # input -> json
+        input_json = jsonable_encoder(data)
+
+        # json -> DataFrame
+        df = pd.DataFrame(input_json["data"])
 
     # Get venue data from Redis
-    venue_df = get_data_from_redis(df["venue_id"].values.tolist())
+    venue_df, valid = await get_data_from_redis(df["venue_id"].values.tolist())
+
+    # Merging and scoring are CPU-bound: run them off the event loop
+    return await run_in_scoring_pool(
+        dataframe_prediction,
+        model,
+        df,
+        venue_df,
+        valid,
+        data.top_k,
+        data.score_threshold,
+    )
+
+
+def dataframe_prediction(
+    model: "Model",
+    df: "pd.DataFrame",
+    venue_df: "pd.DataFrame",
+    valid: np.ndarray,
+    top_k: int | None = None,
+    score_threshold: float | None = None,
+) -> Response:
+    """Score the request with pandas and the model's predict_proba
+
+    Args:
+        model (Model): model scoring the request
+        df (pd.DataFrame): user features of the request with venue ids
+        venue_df (pd.DataFrame): raw venue features with venue ids,
+            one row per row of df
+        valid (np.ndarray): mask of the venues found in the venue data
+        top_k (int | None): return the K best venues only
+        score_threshold (float | None): return the venues scoring at least this
+
+    Returns:
+        Response: list of venue ids with corresponding scores, sorted by score
+    """
+    with stage("merge"):
+        if not valid.all():
+            venue_df.loc[
+                ~valid, venue_data_columns
+            ] = model.normalizer.default_features(venue_data_columns)
+        # Impute & scale venue data as the training data of the model
+        venue_df = model.normalizer.transform(venue_df)
+
+        # The venues are fetched in the order of the request: join them by
+        # position, which keeps the duplicated venue ids of the request
+        df[venue_data_columns] = venue_df[venue_data_columns].to_numpy()
 
-    # Merge data
-    df = df.merge(venue_df, how="inner", on="venue_id")
+        # Pop "venue_id" and turn it into a DataFrame for generating output
+        res_df = df.pop("venue_id").to_frame()
 
-    # Pop "venue_id" and turn it into a DataFrame for generating output
-    res_df = df.pop("venue_id").to_frame()
+    with stage("score"):
+        # Get prediction from the model
+        res_df["score"] = model.model_prediction(df)
+
+    return sorted_output(
+        res_df["venue_id"].tolist(),
+        res_df["score"].to_numpy(),
+        top_k,
+        score_threshold,
+        valid,
+    )
 
-    # Get prediction from the model
-    res_df["score"] = model.model_prediction(df)
 
-    # sort df based on score
-    res_df.sort_values("score", ascending=False, inplace=True)
+async def fast_prediction(data: InputData, model: "Model") -> Response:
+    """Score the request with the pure-NumPy path:
+    one preallocated feature matrix and one matrix-vector product.
+
+    Args:
+        data (InputData): request data consisting a user session
+        model (Model): model scoring the request
 
-    # generate output_json
-    output_json = (
-        '{"data":' + res_df[["venue_id", "score"]].to_json(orient="records") + "}"
+    Returns:
+        Response: list of venue ids with corresponding scores, sorted by score
+    """
+    venue_ids, features, valid = await get_feature_matrix([data])
+
+    return await run_in_scoring_pool(
+        fast_scoring_output,
+        model,
+        venue_ids,
+        features,
+        valid,
+        data.top_k,
+        data.score_threshold,
     )
 
-    output = parse_obj_as(OutputData, json.loads(output_json))
 
-    return output
+async def batch_prediction(batch: list[tuple[InputData, "Model"]]) -> list[Response]:
+    """Score a batch of requests with one Redis round-trip and one model call
+    per model: a swap of the active model may happen while a batch fills
+
+    Args:
+        batch (list[tuple[InputData, Model]]): requests coalesced by the
+            batcher, with the model scoring each of them
+
+    Returns:
+        list[Response]: response of each request, in the order of the batch
+    """
+    # The batch runs in its own task: record its stages apart from the requests
+    stages = start_request()
+
+    outputs = [None] * len(batch)
+    for model in {id(model): model for _, model in batch}.values():
+        positions = [i for i, (_, other) in enumerate(batch) if other is model]
+        requests = [batch[i][0] for i in positions]
+        venue_ids, features, valid = await get_feature_matrix(requests)
+
+        # Row offsets of each request in the feature matrix
+        offsets = np.cumsum([0] + [len(data.data) for data in requests]).tolist()
+        limits = [(data.top_k, data.score_threshold) for data in requests]
+        responses = await run_in_scoring_pool(
+            batch_scoring_output, model, venue_ids, features, valid, offsets, limits
+        )
+        for i, response in zip(positions, responses):
+            outputs[i] = response
+
+    for name, duration in stages.items():
+        stage_latency.observe(duration, name)
+    return outputs
+
+
+async def get_feature_matrix(
+    batch: list[InputData],
+) -> tuple[list, np.ndarray, np.ndarray]:
+    """Fill one preallocated feature matrix for all the items of the requests:
+    user features first, then venue features
+
+    Args:
+        batch (list[InputData]): requests to score
+
+    Returns:
+        tuple[list, np.ndarray, np.ndarray]: venue ids and feature matrix, one
+            row per item, and mask of the venues found in the venue data
+    """
+    with stage("merge"):
+        items = [item for data in batch for item in data.data]
+        venue_ids = [item.venue_id for item in items]
+
+        n_features = len(user_data_columns) + len(venue_data_columns)
+        features = np.empty((len(items), n_features), scoring_dtype)
+        n_user = len(user_data_columns)
+        features[:, :n_user] = [
+            (item.is_new_user, item.is_from_order_again, item.is_recommended)
+            for item in items
+        ]
+    valid = await get_features_from_redis(venue_ids, features[:, n_user:])
+    return venue_ids, features, valid
+
+
+def venue_feature_normalization(
+    model: "Model", features: np.ndarray, valid: np.ndarray
+) -> None:
+    """Impute & scale the raw venue columns of the feature matrix in place,
+    with the statistics of the training data of the model. The venues missing
+    from the venue data get the default features of the model first.
+
+    Args:
+        model (Model): model scoring the features
+        features (np.ndarray): feature matrix, user features first
+        valid (np.ndarray): mask of the venues found in the venue data
+    """
+    with stage("merge"):
+        venue_features = features[:, len(user_data_columns) :]
+        if not valid.all():
+            venue_features[~valid] = model.normalizer.default_features(
+                venue_data_columns
+            )
+        model.normalizer.transform_features(venue_features, venue_data_columns)
+
+
+def score_features(model: "Model", features: np.ndarray) -> np.ndarray:
+    """Score the feature matrix, with the pure-NumPy path if FAST_SCORING is set,
+    otherwise with the model's predict_proba
+
+    Args:
+        model (Model): model scoring the features
+        features (np.ndarray): feature matrix, columns ordered as the model's
+
+    Returns:
+        np.ndarray: score of each row
+    """
+    with stage("score"):
+        if fast_scoring:
+            return model.model_prediction_fast(features)
+        import pandas as pd
+
+        return np.asarray(
+            model.model_prediction(pd.DataFrame(features, columns=model.feature_names))
+        )
+
+
+def fast_scoring_output(
+    model: "Model",
+    venue_ids: list,
+    features: np.ndarray,
+    valid: np.ndarray,
+    top_k: int | None = None,
+    score_threshold: float | None = None,
+) -> Response:
+    """Score the feature matrix and sort the venues by score
+
+    Args:
+        model (Model): model scoring the features
+        venue_ids (list): list of venue ids
+        features (np.ndarray): feature matrix, one row per venue id
+        valid (np.ndarray): mask of the venues found in the venue data
+        top_k (int | None): return the K best venues only
+        score_threshold (float | None): return the venues scoring at least this
+
+    Returns:
+        Response: list of venue ids with corresponding scores, sorted by score
+    """
+    venue_feature_normalization(model, features, valid)
+    with stage("score"):
+        scores = model.model_prediction_fast(features)
+    return sorted_output(venue_ids, scores, top_k, score_threshold, valid)
+
+
+def batch_scoring_output(
+    model: "Model",
+    venue_ids: list,
+    features: np.ndarray,
+    valid: np.ndarray,
+    offsets: list[int],
+    limits: list[tuple[int | None, float | None]],
+) -> list[Response]:
+    """Score the feature matrix of a batch at once, then split it per request
+
+    Args:
+        model (Model): model scoring the features
+        venue_ids (list): list of venue ids of all requests
+        features (np.ndarray): feature matrix, one row per venue id
+        valid (np.ndarray): mask of the venues found in the venue data
+        offsets (list[int]): row offsets of each request, plus the total rows
+        limits (list[tuple[int | None, float | None]]): top_k and
+            score_threshold of each request
+
+    Returns:
+        list[Response]: response of each request, sorted by score
+    """
+    venue_feature_normalization(model, features, valid)
+    scores = score_features(model, features)
+    return [
+        sorted_output(
+            venue_ids[start:end],
+            scores[start:end],
+            top_k,
+            threshold,
+            valid[start:end],
+        )
+        for start, end, (top_k, threshold) in zip(offsets[:-1], offsets[1:], limits)
+    ]
+
+
+def sorted_output(
+    venue_ids: list,
+    scores: np.ndarray,
+    top_k: int | None = None,
+    score_threshold: float | None = None,
+    valid: np.ndarray | None = None,
+) -> Response:
+    """Sort the venues by descending score, ties keep the request order,
+    and encode the response body once, straight from the sorted arrays.
+    Only the returned venues are sorted and encoded, see ranking_order.
+
+    Args:
+        venue_ids (list): list of venue ids
+        scores (np.ndarray): score of each venue
+        top_k (int | None): return the K best venues only
+        score_threshold (float | None): return the venues scoring at least this
+        valid (np.ndarray | None): mask of the venues found in the venue data,
+            the others are left out if MISSING_VENUE_POLICY is "drop"
+
+    Returns:
+        Response: JSON response of the list of venue ids with corresponding
+            scores, sorted by score
+    """
+    with stage("encode"):
+        mask = valid if missing_venue_policy == "drop" else None
+        order = ranking_order(scores, top_k, score_threshold, mask).tolist()
+        records = [
+            {"venue_id": venue_ids[i], "score": score}
+            for i, score in zip(order, scores[order].tolist())
+        ]
+
+        if validate_output:
+            # Validate and serialize in one pass of pydantic-core
+            body = OutputData.model_validate({"data": records}).model_dump_json()
+        else:
+            body = pydantic_core.to_json({"data": records})
+        return Response(body, media_type="application/json")
+
+
+# Batcher of the /prediction/ requests
+batcher = None
+if use_batching:
+    batcher = MicroBatcher(batch_prediction, batch_max_size, batch_max_wait_ms / 1000)
 
 
 if __name__ == "__main__":
+    import uvicorn
+
     # Start the sever, set reload=True for testing
     uvicorn.run("main:app", host="0.0.0.0", port=8002, log_level="info", reload=False)
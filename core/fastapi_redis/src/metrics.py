@@ -0,0 +1,290 @@
+import json
+import random
+import time
+from bisect import bisect_left
+from collections.abc import Iterable
+
+# Upper bounds of the latency histograms, in seconds
+LATENCY_BUCKETS = [
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+]
+
+
+def format_labels(labels: dict[str, str]) -> str:
+    """Format labels as in the Prometheus text format, e.g. {stage="score"}"""
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def format_value(value: float) -> str:
+    """Format a sample value as in the Prometheus text format"""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, one value per combination of label values.
+
+    Counters and histograms are only updated from the event loop, so they
+    need no lock.
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        """Increment the counter of the label values"""
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def collect(self) -> Iterable[str]:
+        """Yield the lines of the counter in the Prometheus text format"""
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for label_values, value in self.values.items():
+            labels = format_labels(dict(zip(self.label_names, label_values)))
+            yield f"{self.name}{labels} {format_value(value)}"
+
+
+class Histogram:
+    """Histogram with fixed buckets, one per combination of label values.
+
+    An observation is one bisection and two additions; the buckets are
+    only made cumulative when the histogram is collected.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple = (),
+        buckets: list[float] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        # label values -> count per bucket, the last one being +Inf
+        self.counts: dict[tuple, list[int]] = {}
+        # label values -> sum of the observed values
+        self.sums: dict[tuple, float] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """Record a value for the label values"""
+        counts = self.counts.get(label_values)
+        if counts is None:
+            counts = self.counts[label_values] = [0] * (len(self.buckets) + 1)
+            self.sums[label_values] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[label_values] += value
+
+    def collect(self) -> Iterable[str]:
+        """Yield the lines of the histogram in the Prometheus text format"""
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for label_values, counts in self.counts.items():
+            labels = dict(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip([*self.buckets, float("inf")], counts):
+                cumulative += count
+                bucket_labels = format_labels({**labels, "le": format_value(bound)})
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            total = format_value(self.sums[label_values])
+            yield f"{self.name}_sum{format_labels(labels)} {total}"
+            yield f"{self.name}_count{format_labels(labels)} {cumulative}"
+
+
+def gauge(
+    name: str, documentation: str, samples: Iterable[tuple[dict[str, str], float]]
+) -> Iterable[str]:
+    """Yield the lines of a gauge computed at collection time
+
+    Args:
+        name (str): name of the metric
+        documentation (str): help text of the metric
+        samples (Iterable[tuple[dict[str, str], float]]): labels and value
+            of each sample
+
+    Returns:
+        Iterable[str]: lines of the gauge in the Prometheus text format
+    """
+    yield f"# HELP {name} {documentation}"
+    yield f"# TYPE {name} gauge"
+    for labels, value in samples:
+        yield f"{name}{format_labels(labels)} {format_value(value)}"
+
+
+def counter(
+    name: str, documentation: str, samples: Iterable[tuple[dict[str, str], float]]
+) -> Iterable[str]:
+    """Yield the lines of a counter kept by another component, read at
+    collection time
+
+    Args:
+        name (str): name of the metric, ending with _total
+        documentation (str): help text of the metric
+        samples (Iterable[tuple[dict[str, str], float]]): labels and value
+            of each sample
+
+    Returns:
+        Iterable[str]: lines of the counter in the Prometheus text format
+    """
+    yield f"# HELP {name} {documentation}"
+    yield f"# TYPE {name} counter"
+    for labels, value in samples:
+        yield f"{name}{format_labels(labels)} {format_value(value)}"
+
+
+# Metrics of the stats of each optional component of the app:
+# component -> (key of its stats, type, help text), the metric being named
+# <component>_<key>, with a _total suffix for the counters
+COMPONENT_METRICS = {
+    "feature_store": [
+        ("venues", "gauge", "Venues of the feature store."),
+        (
+            "hit_ratio",
+            "gauge",
+            "Ratio of the venue lookups served by the feature store.",
+        ),
+        ("hits", "counter", "Venue lookups served by the feature store."),
+        ("misses", "counter", "Venue lookups missed by the feature store."),
+        ("reloads", "counter", "Reloads of the feature store from Redis."),
+    ],
+    "shared_tables": [
+        (
+            "generation",
+            "gauge",
+            "Generation of the shared venue table attached by the worker.",
+        ),
+        ("venues", "gauge", "Venues of the shared venue table."),
+        ("hits", "counter", "Venue lookups served by the shared venue table."),
+        ("misses", "counter", "Venue lookups missed by the shared venue table."),
+    ],
+    "negative_cache": [
+        ("size", "gauge", "Unknown venue ids of the negative cache."),
+        ("hits", "counter", "Venue lookups answered by the negative cache."),
+    ],
+    "result_cache": [
+        ("bytes", "gauge", "Approximate memory of the in-process result cache."),
+        ("entries", "gauge", "Responses of the in-process result cache."),
+        ("hit_ratio", "gauge", "Ratio of the predictions served by the result cache."),
+        ("hits", "counter", "Predictions served by the in-process result cache."),
+        ("redis_hits", "counter", "Predictions served by the Redis result cache."),
+        ("misses", "counter", "Predictions missed by the result cache."),
+        ("evictions", "counter", "Responses evicted from the in-process result cache."),
+    ],
+    "batcher": [
+        ("batches", "counter", "Batches scored by the micro-batcher."),
+        ("requests", "counter", "Requests scored by the micro-batcher."),
+        ("rows", "counter", "Venues scored by the micro-batcher."),
+        (
+            "failed_batches",
+            "counter",
+            "Failed batches of the micro-batcher, retried request by request.",
+        ),
+    ],
+}
+
+
+def component_metrics(component: str, stats: dict) -> Iterable[str]:
+    """Yield the lines of the metrics of an optional component of the app
+
+    Args:
+        component (str): name of the component, a key of COMPONENT_METRICS
+        stats (dict): stats of the component, e.g. from its stats() method
+
+    Returns:
+        Iterable[str]: lines of its metrics in the Prometheus text format
+    """
+    for key, metric_type, documentation in COMPONENT_METRICS[component]:
+        if metric_type == "counter":
+            yield from counter(
+                f"{component}_{key}_total", documentation, [({}, stats[key])]
+            )
+        else:
+            yield from gauge(f"{component}_{key}", documentation, [({}, stats[key])])
+
+
+def model_metrics(model) -> Iterable[str]:
+    """Yield the lines of the metrics of the active model
+
+    Args:
+        model (Model): active model
+
+    Returns:
+        Iterable[str]: lines of its metrics in the Prometheus text format
+    """
+    labels = {
+        "directory": model.model_directory,
+        "version": model.model_version,
+        "postfix": model.model_postfix,
+    }
+    yield from gauge("model_info", "Active model.", [(labels, 1)])
+    yield from gauge(
+        "model_loaded_timestamp_seconds",
+        "Load time of the active model.",
+        [({}, model.loaded_at)],
+    )
+
+
+def redis_pool_metrics(pool_stats: dict) -> Iterable[str]:
+    """Yield the lines of the metrics of the async Redis connection pool
+
+    Args:
+        pool_stats (dict): connection counts of the pool
+
+    Returns:
+        Iterable[str]: lines of its metrics in the Prometheus text format
+    """
+    yield from gauge(
+        "redis_pool_max_connections",
+        "Maximum number of connections of the async Redis connection pool.",
+        [({}, pool_stats["max_connections"])],
+    )
+    yield from gauge(
+        "redis_pool_connections",
+        "Open connections of the async Redis connection pool.",
+        [({"state": state}, pool_stats[state]) for state in ["in_use", "idle"]],
+    )
+
+
+class Profiler:
+    """Dump the stage breakdown of a random sample of the requests, as one
+    JSON line per request on stdout, e.g. to be collected with the logs.
+    """
+
+    def __init__(self, sample_rate: float = 0.0):
+        self.sample_rate = sample_rate
+
+    def sampled(self) -> bool:
+        """Return whether to dump the current request"""
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def dump(self, handler: str, status_code: int, stages: dict[str, float]) -> None:
+        """Write the stage durations of a request, in milliseconds"""
+        record = {
+            "time": time.time(),
+            "handler": handler,
+            "status": status_code,
+            "stages_ms": {name: duration * 1000 for name, duration in stages.items()},
+        }
+        print(json.dumps(record), flush=True)
@@ -1,15 +1,44 @@
+import argparse
 import json
 import os
+import sys
+import tempfile
+import time
+from collections.abc import Iterator
 from datetime import datetime
 
 import numpy as np
 import pandas as pd
 from joblib import dump, load
-from sklearn.linear_model import LogisticRegression
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 from sklearn.metrics import f1_score, precision_score, recall_score, roc_auc_score
-from sklearn.model_selection import train_test_split
-
-from data import session_data_preprocessing, venue_data_preprocessing
+from sklearn.model_selection import (
+    GridSearchCV,
+    RandomizedSearchCV,
+    StratifiedKFold,
+    train_test_split,
+)
+
+from data import VenueNormalizer, session_data_preprocessing, venue_data_cleaning
+from dataset_cache import DatasetCache, dataset_key
+
+# Hyperparameters explored by the sweep: regularization & class weights
+PARAM_GRID = {
+    "C": [0.01, 0.1, 1.0, 10.0, 100.0],
+    "class_weight": [None, "balanced"],
+}
+# Candidates of the random search, 10 per decade of C on a log scale
+PARAM_DISTRIBUTIONS = {
+    "C": np.logspace(-3, 3, 61).tolist(),
+    "class_weight": [None, "balanced"],
+}
+# Metrics of each candidate of the sweep, the first one selects the model
+SWEEP_SCORING = {
+    "roc-auc": "roc_auc",
+    "precision": "precision",
+    "recall": "recall",
+    "f1": "f1",
+}
 
 
 def metrics_computation(
@@ -32,28 +61,176 @@ def metrics_computation(
     return roc_auc, precision, recall, f1
 
 
+class StreamingMetrics:
+    """Evaluation metrics computed incrementally over chunks of data.
+
+    Precision, recall and f1 are exact. The roc-auc is computed from
+    histograms of the predicted probability, so it is exact up to ties
+    within one of the `n_bins` bins.
+    """
+
+    def __init__(self, n_bins: int = 1000):
+        self.n_bins = n_bins
+        self.positive_hist = np.zeros(n_bins, dtype=np.int64)
+        self.negative_hist = np.zeros(n_bins, dtype=np.int64)
+        self.tp, self.fp, self.fn = 0, 0, 0
+
+    def update(
+        self, label: pd.Series, prediction: np.ndarray, probability: np.ndarray
+    ) -> None:
+        """Add a chunk of labels and predictions
+
+        Args:
+            label (pd.Series): label of the chunk
+            prediction (np.ndarray): Predicted class
+            probability (np.ndarray): Predicted probability
+        """
+        label = np.asarray(label, dtype=bool)
+        prediction = np.asarray(prediction, dtype=bool)
+        self.tp += int(np.sum(label & prediction))
+        self.fp += int(np.sum(~label & prediction))
+        self.fn += int(np.sum(label & ~prediction))
+
+        bins = np.minimum((probability * self.n_bins).astype(int), self.n_bins - 1)
+        self.positive_hist += np.bincount(bins[label], minlength=self.n_bins)
+        self.negative_hist += np.bincount(bins[~label], minlength=self.n_bins)
+
+    def compute(self) -> tuple[float, float, float, float]:
+        """Return the metrics of all chunks so far
+
+        Returns:
+            tuple[float, float, float, float]: roc_auc, precision, recall, f1
+        """
+        # Probability that a positive scores above a negative, ties count half
+        negatives_below = np.cumsum(self.negative_hist) - self.negative_hist
+        pairs = self.positive_hist.sum() * self.negative_hist.sum()
+        roc_auc = (
+            np.sum(self.positive_hist * (negatives_below + 0.5 * self.negative_hist))
+            / pairs
+            if pairs
+            else 0.0
+        )
+
+        precision = self.tp / (self.tp + self.fp) if self.tp + self.fp else 0.0
+        recall = self.tp / (self.tp + self.fn) if self.tp + self.fn else 0.0
+        f1 = (
+            2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        )
+        return float(roc_auc), precision, recall, f1
+
+
+def read_session_chunks(
+    session_data_path: str, chunk_size: int
+) -> Iterator[pd.DataFrame]:
+    """Read the raw session data of a CSV file in chunks of whole sessions.
+    The rows of a session are expected to be contiguous: the last session of
+    each chunk is held back and completed with the next chunk.
+
+    Args:
+        session_data_path (str): path of the session data file
+        chunk_size (int): number of rows per chunk
+
+    Yields:
+        Iterator[pd.DataFrame]: raw session DataFrame of whole sessions
+    """
+    carry = None
+    for chunk in pd.read_csv(session_data_path, chunksize=chunk_size):
+        if carry is not None:
+            chunk = pd.concat([carry, chunk])
+        last_session = chunk["session_id"].values == chunk["session_id"].values[-1]
+        carry = chunk[last_session]
+        if not last_session.all():
+            yield chunk[~last_session]
+    if carry is not None:
+        yield carry
+
+
 class Model:
     def __init__(self):
         self.model_version: str = "1.0"
         self.model: LogisticRegression = LogisticRegression()
-
-    def model_loading(self, model_directory: str) -> None:
+        # Registry directory & postfix of the loaded artifact, and when it was loaded
+        self.model_directory: str = ""
+        self.model_postfix: str = ""
+        self.loaded_at: float = 0.0
+        # Fitted parameters used by the pure-NumPy scoring path
+        self.feature_names: list[str] = []
+        self.coef: np.ndarray = np.empty(0)
+        self.intercept: float = 0.0
+        # Venue imputation & scaling statistics of the training data
+        self.normalizer: VenueNormalizer = VenueNormalizer()
+
+    def model_loading(
+        self,
+        model_directory: str,
+        mmap_mode: str | None = None,
+        venue_data_path: str | None = None,
+    ) -> None:
         """Load the model artifact from given directory
 
         Args:
             model_directory (str): model artifact directory
+            mmap_mode (str | None): memory-map the arrays of the artifact,
+                see joblib.load
+            venue_data_path (str | None): venue data to fit the venue
+                normalization on, for artifacts saved without its statistics
         """
-        self.model = load(os.path.join("registry", model_directory, "model.joblib"))
+        self.model = load(
+            os.path.join("registry", model_directory, "model.joblib"),
+            mmap_mode=mmap_mode,
+        )
+        normalization_path = os.path.join(
+            "registry", model_directory, "venue_normalization.json"
+        )
+        if os.path.exists(normalization_path):
+            self.normalizer = VenueNormalizer.load(normalization_path)
+        elif venue_data_path is not None:
+            # Artifacts saved before the statistics were: fit them as in training
+            venue_df = venue_data_cleaning(pd.read_csv(venue_data_path))
+            self.normalizer = VenueNormalizer().fit(venue_df)
+        else:
+            raise ValueError(
+                f"{model_directory} has no venue normalization statistics, "
+                "and no venue data to fit them on"
+            )
+        self.model_directory = model_directory
+        # Directory name: model_<version>_<postfix>
+        self.model_version, self.model_postfix = model_directory.split("_", 2)[1:]
+        self.loaded_at = time.time()
+        self.coefficient_extraction()
+
+    def coefficient_extraction(self, atol: float = 1e-9) -> None:
+        """Pull the fitted coefficients out of the model for fast scoring,
+        and verify the fast path against predict_proba on random probes
 
-    def model_training(self, session_data_path: str, venue_data_path: str):
+        Args:
+            atol (float): absolute tolerance of the verification
+        """
+        self.feature_names = list(self.model.feature_names_in_)
+        self.coef = np.ascontiguousarray(self.model.coef_[0], dtype=np.float64)
+        self.intercept = float(self.model.intercept_[0])
+
+        probe = np.random.default_rng(42).random((64, len(self.feature_names)))
+        expected = self.model.predict_proba(
+            pd.DataFrame(probe, columns=self.feature_names)
+        )[:, 1]
+        if not np.allclose(self.model_prediction_fast(probe), expected, atol=atol):
+            raise ValueError("Fast scoring path does not match predict_proba")
+
+    def model_training(
+        self, session_data_path: str, venue_data_path: str, use_cache: bool = False
+    ):
         """Train the model using given session and venue data
 
         Args:
             session_data_path (str): path of the session data file
             venue_data_path (str): path of the venue data file
+            use_cache (bool): load/store the preprocessed dataset from/in the cache
         """
         # Obtain dataset
-        dataset = self.feature_preprocessing(session_data_path, venue_data_path)
+        dataset = self.feature_preprocessing(
+            session_data_path, venue_data_path, use_cache
+        )
 
         # Split the dataset into training and validation set
         # -> 70% training, 30% validation
@@ -67,6 +244,104 @@ class Model:
         self.model = LogisticRegression()
         self.model.fit(trn, trn_label)
 
+        trn_metrics, val_metrics = self.model_evaluation(trn, trn_label, val, val_label)
+        self.save_model(trn_metrics, val_metrics)
+
+    def model_training_sweep(
+        self,
+        session_data_path: str,
+        venue_data_path: str,
+        use_cache: bool = False,
+        search: str = "grid",
+        n_iter: int = 20,
+        cv_folds: int = 5,
+        n_jobs: int = -1,
+    ):
+        """Search the hyperparameters with k-fold cross-validation in parallel,
+        then train the best candidate on the whole training set
+
+        Args:
+            session_data_path (str): path of the session data file
+            venue_data_path (str): path of the venue data file
+            use_cache (bool): load/store the preprocessed dataset from/in the cache
+            search (str): "grid" over PARAM_GRID,
+                or "random" over PARAM_DISTRIBUTIONS
+            n_iter (int): number of candidates of the random search
+            cv_folds (int): number of cross-validation folds
+            n_jobs (int): number of worker processes, -1 for all cores
+        """
+        # Obtain dataset
+        dataset = self.feature_preprocessing(
+            session_data_path, venue_data_path, use_cache
+        )
+
+        # Same split as model_training: the validation set is kept out of the sweep
+        trn, val = train_test_split(
+            dataset, stratify=dataset["purchased"], test_size=0.3, random_state=42
+        )
+        trn_label, val_label = trn.pop("purchased"), val.pop("purchased")
+
+        estimator = LogisticRegression(max_iter=1000)
+        cv = StratifiedKFold(n_splits=cv_folds, shuffle=True, random_state=42)
+        if search == "random":
+            searcher = RandomizedSearchCV(
+                estimator,
+                PARAM_DISTRIBUTIONS,
+                n_iter=n_iter,
+                random_state=42,
+                scoring=SWEEP_SCORING,
+                cv=cv,
+                n_jobs=n_jobs,
+                refit=False,
+            )
+        else:
+            searcher = GridSearchCV(
+                estimator,
+                PARAM_GRID,
+                scoring=SWEEP_SCORING,
+                cv=cv,
+                n_jobs=n_jobs,
+                refit=False,
+            )
+
+        # Share the training set with the workers through a memory-mapped file:
+        # each worker maps the same pages instead of receiving a copy
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "training_set.joblib")
+            dump((trn.to_numpy(dtype=np.float64), trn_label.to_numpy()), path)
+            features, label = load(path, mmap_mode="r")
+            searcher.fit(features, label)
+            del features, label
+
+        # Refit the best candidate on the DataFrame, to keep the feature names
+        cv_results = searcher.cv_results_
+        best = int(np.argmax(cv_results["mean_test_roc-auc"]))
+        self.model = LogisticRegression(max_iter=1000, **cv_results["params"][best])
+        self.model.fit(trn, trn_label)
+
+        trn_metrics, val_metrics = self.model_evaluation(trn, trn_label, val, val_label)
+        self.save_model(trn_metrics, val_metrics)
+        self.save_sweep_results(cv_results, best)
+
+    def model_evaluation(
+        self,
+        trn: pd.DataFrame,
+        trn_label: pd.Series,
+        val: pd.DataFrame,
+        val_label: pd.Series,
+    ) -> tuple[tuple[float, float, float, float], tuple[float, float, float, float]]:
+        """Compute the evaluation metrics on the training and validation set
+
+        Args:
+            trn (pd.DataFrame): training set
+            trn_label (pd.Series): label of the training set
+            val (pd.DataFrame): validation set
+            val_label (pd.Series): label of the validation set
+
+        Returns:
+            tuple[tuple[float, float, float, float], tuple[...]]:
+                metrics of the training set, metrics of the validation set
+        """
         # Getting evaluation metric from training and validation set
         trn_pred = self.model.predict(trn)
         trn_prob = self.model.predict_proba(trn)[:, 1]
@@ -76,6 +351,68 @@ class Model:
         val_prob = self.model.predict_proba(val)[:, 1]
         val_metrics = metrics_computation(val_label, val_pred, val_prob)
 
+        return trn_metrics, val_metrics
+
+    def model_training_streaming(
+        self,
+        session_data_path: str,
+        venue_data_path: str,
+        chunk_size: int = 100_000,
+        epochs: int = 5,
+    ):
+        """Train the model chunk by chunk with an incremental learner,
+        so that the peak memory is bounded by the chunk size
+
+        Args:
+            session_data_path (str): path of the session data CSV file
+            venue_data_path (str): path of the venue data file
+            chunk_size (int): number of session rows per chunk
+            epochs (int): number of passes over the session data
+        """
+        # Venue data is small: preprocess it once
+        venue_df = self.venue_normalization_fitting(venue_data_path)
+
+        # Model training
+        self.model = SGDClassifier(loss="log_loss", random_state=42)
+        for _ in range(epochs):
+            for dataset, is_validation in self.streaming_dataset(
+                session_data_path, venue_df, chunk_size
+            ):
+                trn = dataset[~is_validation]
+                trn_label = trn.pop("purchased")
+                if len(trn):
+                    self.model.partial_fit(trn, trn_label, classes=[False, True])
+
+        # Getting evaluation metric from training and validation set
+        trn_metrics, val_metrics = StreamingMetrics(), StreamingMetrics()
+        for dataset, is_validation in self.streaming_dataset(
+            session_data_path, venue_df, chunk_size
+        ):
+            label = dataset.pop("purchased")
+            pred = self.model.predict(dataset)
+            prob = self.model.predict_proba(dataset)[:, 1]
+            trn_metrics.update(
+                label[~is_validation], pred[~is_validation], prob[~is_validation]
+            )
+            val_metrics.update(
+                label[is_validation], pred[is_validation], prob[is_validation]
+            )
+
+        self.save_model(trn_metrics.compute(), val_metrics.compute())
+
+    def save_model(
+        self,
+        trn_metrics: tuple[float, float, float, float],
+        val_metrics: tuple[float, float, float, float],
+    ) -> None:
+        """Save the model artifact and its evaluation metrics into the registry
+
+        Args:
+            trn_metrics (tuple[float, float, float, float]):
+                evaluation metrics of the training set
+            val_metrics (tuple[float, float, float, float]):
+                evaluation metrics of the validation set
+        """
         # String of current date & time: used as postfix
         postfix = datetime.now().strftime("%d%m%y_%H%M%S")
 
@@ -86,6 +423,10 @@ class Model:
         # Training & validation set should be saved as well in work
         # Save model artifact
         dump(self.model, os.path.join(self.model_saving_path, "model.joblib"))
+        # Save the venue normalization statistics, applied again at serving time
+        self.normalizer.save(
+            os.path.join(self.model_saving_path, "venue_normalization.json")
+        )
         # Save model evaluation metrics
         self.save_model_metrics(postfix, trn_metrics, val_metrics)
 
@@ -129,6 +470,40 @@ class Model:
         ) as f:
             json.dump(model_metrics_json, f, ensure_ascii=False, indent=4)
 
+    def save_sweep_results(self, cv_results: dict, best: int) -> None:
+        """Save the cross-validation metrics of every candidate of the sweep
+        into a json file, next to the model artifact
+
+        Args:
+            cv_results (dict): cv_results_ of the search
+            best (int): index of the selected candidate
+        """
+        candidates = [
+            {
+                "params": {
+                    name: value.item() if isinstance(value, np.generic) else value
+                    for name, value in params.items()
+                },
+                "selected": i == best,
+                "metrics": {
+                    metric: {
+                        "mean": float(cv_results[f"mean_test_{metric}"][i]),
+                        "std": float(cv_results[f"std_test_{metric}"][i]),
+                    }
+                    for metric in SWEEP_SCORING
+                },
+                "fit time (s)": float(cv_results["mean_fit_time"][i]),
+            }
+            for i, params in enumerate(cv_results["params"])
+        ]
+
+        with open(
+            os.path.join(self.model_saving_path, "sweep_results.json"),
+            "w",
+            encoding="utf-8",
+        ) as f:
+            json.dump(candidates, f, ensure_ascii=False, indent=4)
+
     def model_prediction(self, test_data: pd.DataFrame) -> list[float]:
         """Run the model on given test data and return the probability
 
@@ -140,25 +515,92 @@ class Model:
         """
         return self.model.predict_proba(test_data)[:, 1].tolist()
 
+    def model_prediction_fast(self, features: np.ndarray) -> np.ndarray:
+        """Score a feature matrix with the extracted coefficients,
+        as one matrix-vector product followed by the logistic function
+
+        Args:
+            features (np.ndarray): matrix of shape (n_rows, n_features),
+                columns ordered as self.feature_names
+
+        Returns:
+            np.ndarray: predicted probability of the positive class
+        """
+        logits = features @ self.coef.astype(features.dtype, copy=False)
+        logits += self.intercept
+        return 1.0 / (1.0 + np.exp(-logits))
+
     def feature_preprocessing(
-        self, session_data_path: str, venue_data_path: str
+        self, session_data_path: str, venue_data_path: str, use_cache: bool = False
     ) -> pd.DataFrame:
         """Preprocess the session and venue data and return a dataset for model training
 
         Args:
             session_data_path (str): path of the session data file
             venue_data_path (str): path of the venue data file
+            use_cache (bool): load/store the dataset from/in the cache, keyed by
+                the content of the data files and the preprocessing code
 
         Returns:
             pd.DataFrame: dataset contains feature columns only for model training
         """
+        start = time.perf_counter()
+        # Fitted even if the dataset is cached: the model artifact needs it
+        venue_df = self.venue_normalization_fitting(venue_data_path)
+        if use_cache:
+            cache = DatasetCache(os.getenv("DATASET_CACHE_DIR", "cache"))
+            key = dataset_key(
+                [session_data_path, venue_data_path],
+                session_data_preprocessing,
+                venue_data_cleaning,
+                VenueNormalizer,
+                Model.feature_preprocessing,
+                Model.venue_normalization_fitting,
+                Model.feature_merging,
+            )
+            dataset = cache.load(key)
+            if dataset is not None:
+                elapsed = time.perf_counter() - start
+                print(f"Dataset loaded from cache (warm): {elapsed:.2f}s")
+                return dataset
+
         # Load data into dataframe
         session_df = pd.read_csv(session_data_path)
-        venue_df = pd.read_csv(venue_data_path)
-
         session_df = session_data_preprocessing(session_df)
-        venue_df = venue_data_preprocessing(venue_df)
 
+        dataset = self.feature_merging(session_df, venue_df)
+        elapsed = time.perf_counter() - start
+        print(f"Dataset preprocessed (cold): {elapsed:.2f}s")
+
+        if use_cache:
+            cache.save(key, dataset)
+        return dataset
+
+    def venue_normalization_fitting(self, venue_data_path: str) -> pd.DataFrame:
+        """Fit the venue normalization on the venue data and apply it
+
+        Args:
+            venue_data_path (str): path of the venue data file
+
+        Returns:
+            pd.DataFrame: venue DataFrame after preprocessing
+        """
+        venue_df = venue_data_cleaning(pd.read_csv(venue_data_path))
+        self.normalizer = VenueNormalizer().fit(venue_df)
+        return self.normalizer.transform(venue_df)
+
+    def feature_merging(
+        self, session_df: pd.DataFrame, venue_df: pd.DataFrame
+    ) -> pd.DataFrame:
+        """Merge the preprocessed session and venue data into a dataset
+
+        Args:
+            session_df (pd.DataFrame): session DataFrame after preprocessing
+            venue_df (pd.DataFrame): venue DataFrame after preprocessing
+
+        Returns:
+            pd.DataFrame: dataset contains feature columns only for model training
+        """
         # Merge data from session and venue, based on venue_id
         dataset = pd.merge(session_df, venue_df, how="left", on="venue_id")
         dataset.reset_index(drop=True, inplace=True)
@@ -177,7 +619,113 @@ class Model:
 
         return dataset
 
+    def streaming_dataset(
+        self, session_data_path: str, venue_df: pd.DataFrame, chunk_size: int
+    ) -> Iterator[tuple[pd.DataFrame, np.ndarray]]:
+        """Preprocess the session data chunk by chunk and merge it with venues
+
+        Args:
+            session_data_path (str): path of the session data file
+            venue_df (pd.DataFrame): venue DataFrame after preprocessing
+            chunk_size (int): number of session rows per chunk
+
+        Yields:
+            Iterator[tuple[pd.DataFrame, np.ndarray]]: dataset of the chunk,
+                and the mask of its rows in the validation set
+        """
+        for session_df in read_session_chunks(session_data_path, chunk_size):
+            session_df = session_data_preprocessing(session_df)
+            # Split by session: the same 30% of sessions land in the
+            # validation set on every pass over the data
+            is_validation = (
+                pd.util.hash_pandas_object(session_df["session_id"], index=False).values
+                % 100
+                < 30
+            )
+            yield self.feature_merging(session_df, venue_df), is_validation
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Train the venue ranking model")
+    parser.add_argument(
+        "--session-data-path",
+        default=os.getenv("SESSION_DATA_PATH"),
+        help="Path of the session data file (default $SESSION_DATA_PATH).",
+    )
+    parser.add_argument(
+        "--venue-data-path",
+        default=os.getenv("VENUE_DATA_PATH"),
+        help="Path of the venue data file (default $VENUE_DATA_PATH).",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["batch", "streaming", "sweep"],
+        default=os.getenv("TRAINING_MODE", "batch"),
+        help="batch: fit in memory, "
+        "streaming: fit chunk by chunk with bounded memory, "
+        "sweep: cross-validated hyperparameter search in parallel.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="use_cache",
+        action="store_false",
+        help="Preprocess the data from scratch, bypassing the dataset cache.",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=100_000,
+        help="Session rows per chunk in streaming mode.",
+    )
+    parser.add_argument(
+        "--epochs",
+        type=int,
+        default=5,
+        help="Passes over the session data in streaming mode.",
+    )
+    parser.add_argument(
+        "--search",
+        choices=["grid", "random"],
+        default="grid",
+        help="Hyperparameter search in sweep mode.",
+    )
+    parser.add_argument(
+        "--n-iter",
+        type=int,
+        default=20,
+        help="Candidates of the random search in sweep mode.",
+    )
+    parser.add_argument(
+        "--cv-folds",
+        type=int,
+        default=5,
+        help="Cross-validation folds in sweep mode.",
+    )
+    parser.add_argument(
+        "--n-jobs",
+        type=int,
+        default=-1,
+        help="Worker processes in sweep mode, -1 for all cores.",
+    )
+    return parser.parse_args(argv)
+
 
 if __name__ == "__main__":
+    args = parse_arguments(sys.argv[1:])
     m = Model()
-    m.model_training(os.getenv("SESSION_DATA_PATH"), os.getenv("VENUE_DATA_PATH"))
+    if args.mode == "streaming":
+        m.model_training_streaming(
+            args.session_data_path, args.venue_data_path, args.chunk_size, args.epochs
+        )
+    elif args.mode == "sweep":
+        m.model_training_sweep(
+            args.session_data_path,
+            args.venue_data_path,
+            args.use_cache,
+            args.search,
+            args.n_iter,
+            args.cv_folds,
+            args.n_jobs,
+        )
+    else:
+        m.model_training(args.session_data_path, args.venue_data_path, args.use_cache)
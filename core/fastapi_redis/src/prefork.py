@@ -0,0 +1,189 @@
+import argparse
+import gc
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+import traceback
+
+from feature_store import VERSION_KEY, read_venue_table
+from shared_tables import SharedVenueTables
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        description="Serve the app with pre-forked workers sharing one copy of "
+        "the models and of the venue table"
+    )
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, help="Worker processes."
+    )
+    parser.add_argument(
+        "--shared-dir",
+        default=None,
+        help="Directory of the shared venue table, a temporary directory of "
+        "/dev/shm by default.",
+    )
+    parser.add_argument(
+        "--refresh-interval",
+        type=float,
+        default=float(os.getenv("FEATURE_STORE_TTL", "30")),
+        help="Seconds between two checks of the venue data version in Redis.",
+    )
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args(argv)
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    """Bind the listening socket once in the parent, shared by all workers"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def publish_tables(server, tables: SharedVenueTables) -> bytes | None:
+    """Read the venue table from Redis and publish it with the active model
+
+    Args:
+        server (module): the app module, main
+        tables (SharedVenueTables): shared venue table
+
+    Returns:
+        bytes | None: version of the published venue data
+    """
+    venue_ids, matrix, version = read_venue_table(
+        server.r, server.codec, len(server.venue_data_columns)
+    )
+    generation = tables.publish(
+        venue_ids,
+        matrix,
+        {
+            "version": version.decode() if version else None,
+            "model_directory": server.registry.active.model_directory,
+        },
+    )
+    print(
+        f"Published generation {generation}: {len(venue_ids)} venues, "
+        f"model {server.registry.active.model_directory}",
+        flush=True,
+    )
+    return version
+
+
+def spawn_worker(app, sock: socket.socket, log_level: str) -> int:
+    """Fork a worker serving the app on the shared socket
+
+    Returns:
+        int: pid of the worker
+    """
+    pid = os.fork()
+    if pid == 0:
+        import uvicorn
+
+        # Uvicorn installs its own handlers for a graceful shutdown
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        status = 0
+        try:
+            uvicorn.Server(uvicorn.Config(app, log_level=log_level)).run(sockets=[sock])
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+        finally:
+            os._exit(status)
+    return pid
+
+
+def main(args):
+    shared_dir = args.shared_dir or tempfile.mkdtemp(
+        prefix="venue_tables_",
+        dir="/dev/shm" if os.path.isdir("/dev/shm") else None,
+    )
+    # Read by main at import: the workers attach the shared table
+    os.environ["SHARED_TABLES_DIR"] = shared_dir
+
+    import main as server
+
+    # Everything loaded here before forking is shared by the workers
+    # copy-on-write: imported modules, models and their arrays
+    if server.ingest_on_startup:
+        server.import_venue_data()
+    server.load_models()
+    tables = SharedVenueTables(shared_dir)
+    version = publish_tables(server, tables)
+    checked_at = time.monotonic()
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Keep the collector of the workers away from the objects loaded so far,
+    # so that their pages stay shared instead of being copied on write
+    gc.freeze()
+    sock = bind_socket(args.host, args.port)
+    workers = {
+        spawn_worker(server.app, sock, args.log_level) for _ in range(args.workers)
+    }
+    print(
+        f"Serving on http://{args.host}:{args.port} with {args.workers} workers",
+        flush=True,
+    )
+
+    while not stopping:
+        time.sleep(0.1)
+
+        # Replace the workers which died
+        for pid in list(workers):
+            if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                workers.remove(pid)
+                if not stopping:
+                    print(f"Worker {pid} exited, restarting it", flush=True)
+                    workers.add(spawn_worker(server.app, sock, args.log_level))
+
+        # Publish a new generation when the venues or the requested model change
+        requested_model = tables.requested_model()
+        if requested_model is None and time.monotonic() - checked_at < (
+            args.refresh_interval
+        ):
+            continue
+        checked_at = time.monotonic()
+        try:
+            active = server.registry.active.model_directory
+            if requested_model is not None:
+                server.registry.activate(requested_model)
+            # No version while an import is writing: wait for the next one
+            current = server.r.get(VERSION_KEY)
+            if (
+                current is not None
+                and current != version
+                or server.registry.active.model_directory != active
+            ):
+                version = publish_tables(server, tables)
+        except Exception:
+            # Keep serving the current generation
+            traceback.print_exc()
+
+    for pid in workers:
+        os.kill(pid, signal.SIGTERM)
+    for pid in workers:
+        os.waitpid(pid, 0)
+    sock.close()
+    if args.shared_dir is None:
+        shutil.rmtree(shared_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(parse_arguments(sys.argv[1:]))
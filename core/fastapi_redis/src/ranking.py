@@ -0,0 +1,67 @@
+import numpy as np
+
+# Below this number of candidates, a full sort is faster than a partial selection
+PARTIAL_SELECTION_MIN_CANDIDATES = 512
+
+
+def ranking_order(
+    scores: np.ndarray,
+    top_k: int | None = None,
+    score_threshold: float | None = None,
+    mask: np.ndarray | None = None,
+) -> np.ndarray:
+    """Return the indices of the venues by descending score.
+
+    Ties are ranked in request order (lowest index first), also at the K-th
+    position: when tied scores straddle the cut, the earliest venues are kept.
+    For long lists, only the K selected venues are sorted, so that the cost is
+    O(n + K log K) instead of O(n log n).
+
+    Args:
+        scores (np.ndarray): score of each venue
+        top_k (int | None): keep the K best venues only, all of them if None
+            or if there are fewer than K
+        score_threshold (float | None): keep the venues with a score greater
+            than or equal to the threshold only
+        mask (np.ndarray | None): keep the venues where the mask is True only
+
+    Returns:
+        np.ndarray: indices of the kept venues, best first
+
+    Examples:
+        >>> scores = np.array([0.2, 0.9, 0.5, 0.9, 0.5])
+        >>> ranking_order(scores)
+        array([1, 3, 2, 4, 0])
+        >>> ranking_order(scores, top_k=3)
+        array([1, 3, 2])
+        >>> ranking_order(scores, top_k=10)
+        array([1, 3, 2, 4, 0])
+        >>> ranking_order(scores, score_threshold=0.5)
+        array([1, 3, 2, 4])
+        >>> ranking_order(scores, top_k=1, score_threshold=0.95)
+        array([], dtype=int64)
+        >>> ranking_order(scores, top_k=2, mask=np.array([1, 0, 1, 1, 1], bool))
+        array([3, 2])
+    """
+    keep = mask
+    if score_threshold is not None:
+        above = scores >= score_threshold
+        keep = above if keep is None else keep & above
+    candidates = np.arange(len(scores)) if keep is None else np.flatnonzero(keep)
+
+    candidate_scores = scores[candidates]
+    if top_k is not None and len(candidates) < PARTIAL_SELECTION_MIN_CANDIDATES:
+        return candidates[np.argsort(-candidate_scores, kind="stable")[:top_k]]
+
+    if top_k is not None and top_k < len(candidates):
+        # Score of the K-th best candidate, found in linear time
+        kth_score = -np.partition(-candidate_scores, top_k - 1)[top_k - 1]
+        # Candidates above it, plus the earliest ones tied with it
+        above = candidate_scores > kth_score
+        tied = np.flatnonzero(candidate_scores == kth_score)
+        above[tied[: top_k - np.count_nonzero(above)]] = True
+        candidates = candidates[above]
+        candidate_scores = candidate_scores[above]
+
+    # The candidates are in request order: a stable sort keeps it for ties
+    return candidates[np.argsort(-candidate_scores, kind="stable")]
@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from model import Model
+
+
+class ModelRegistry:
+    """Models of the `registry/` folder, preloaded in memory.
+
+    The active model is swapped by replacing one reference, so a request that
+    picked up the previous model keeps scoring with it until it completes.
+    """
+
+    def __init__(
+        self,
+        feature_names: list[str],
+        registry_path: str = "registry",
+        mmap_mode: str | None = None,
+        venue_data_path: str | None = None,
+    ):
+        self.feature_names = feature_names
+        self.registry_path = registry_path
+        self.mmap_mode = mmap_mode
+        # Fallback for the models saved without venue normalization statistics
+        self.venue_data_path = venue_data_path
+        self.models: dict[str, "Model"] = {}
+        self.active: "Model | None" = None
+        # Serialize loading and swapping, requests only read self.active
+        self.lock = threading.Lock()
+
+    def scan(self) -> dict[str, dict]:
+        """Find the model artifacts of the registry and read their metrics
+
+        Returns:
+            dict[str, dict]: model directory -> content of model_metrics.json
+        """
+        metrics = {}
+        for model_directory in sorted(os.listdir(self.registry_path)):
+            path = os.path.join(self.registry_path, model_directory)
+            if not os.path.isfile(os.path.join(path, "model.joblib")):
+                continue
+            try:
+                with open(
+                    os.path.join(path, "model_metrics.json"), encoding="utf-8"
+                ) as f:
+                    metrics[model_directory] = json.load(f)
+            except FileNotFoundError:
+                metrics[model_directory] = {}
+        return metrics
+
+    def load(self, model_directory: str) -> "Model":
+        """Load a model of the registry, or return it if already loaded
+
+        Args:
+            model_directory (str): model artifact directory
+
+        Returns:
+            Model: loaded model
+        """
+        with self.lock:
+            if model_directory not in self.models:
+                if model_directory not in self.scan():
+                    raise KeyError(f"Model not found in registry: {model_directory}")
+
+                # Imported on first use: scikit-learn is slow to import
+                from model import Model
+
+                model = Model()
+                model.model_loading(
+                    model_directory, self.mmap_mode, self.venue_data_path
+                )
+                # The serving path fills the feature matrix in this column order
+                if model.feature_names != self.feature_names:
+                    raise ValueError(
+                        f"Unexpected features of {model_directory}: "
+                        f"{model.feature_names}"
+                    )
+                self.models[model_directory] = model
+            return self.models[model_directory]
+
+    def preload(self, model_directories: list[str]) -> None:
+        """Load the given models in memory, `["all"]` loads every model
+
+        Args:
+            model_directories (list[str]): model artifact directories
+        """
+        if model_directories == ["all"]:
+            model_directories = list(self.scan())
+        for model_directory in model_directories:
+            self.load(model_directory)
+
+    def activate(self, model_directory: str) -> "Model":
+        """Load the model if needed and make it the active model
+
+        Args:
+            model_directory (str): model artifact directory
+
+        Returns:
+            Model: new active model
+        """
+        model = self.load(model_directory)
+        self.active = model
+        return model
+
+    def list_models(self) -> list[dict]:
+        """Return the models of the registry with their metrics and status"""
+        return [
+            {
+                "model_directory": model_directory,
+                "loaded": model_directory in self.models,
+                "active": self.active is not None
+                and self.active.model_directory == model_directory,
+                "metrics": metrics,
+            }
+            for model_directory, metrics in self.scan().items()
+        ]
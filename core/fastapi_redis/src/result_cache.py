@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+import redis.asyncio
+
+from feature_store import VERSION_KEY
+
+# Prefix of the result keys in Redis
+RESULT_KEY_PREFIX = "result:"
+# Approximate memory of an entry besides its key and body: dict slot,
+# bytes objects headers and the (expiry, body) tuple
+ENTRY_OVERHEAD = 200
+
+
+class ResultCache:
+    """Cache of the encoded /prediction/ responses, in front of the scoring.
+
+    The entries are keyed by a hash of the request, of the active model and
+    of the venue data version, so that a model swap or a venue import never
+    serves a stale result; the entries of the previous model or version are
+    dropped as soon as they change. The in-process entries are evicted least
+    recently used first beyond `max_bytes`, and expire after `ttl` seconds.
+    With a Redis client, the results are also shared with the other server
+    processes through Redis, with the same TTL.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl: float,
+        client: redis.asyncio.Redis,
+        use_redis: bool = False,
+        version_check_interval: float = 1.0,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.r = client
+        self.use_redis = use_redis
+        self.version_check_interval = version_check_interval
+        # key -> (expiry time, response body), least recently used first
+        self.entries: OrderedDict[bytes, tuple[float, bytes]] = OrderedDict()
+        self.bytes: int = 0
+        # Model and venue data version of the entries
+        self.scope: tuple | None = None
+        self.version: bytes | None = None
+        self.checked_at: float = 0.0
+        # Background writes to Redis
+        self.pending: set[asyncio.Task] = set()
+        # Counters
+        self.hits: int = 0
+        self.redis_hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    async def venue_version(self) -> bytes | None:
+        """Return the version of the venue data in Redis, read at most once
+        per `version_check_interval` seconds
+        """
+        if time.monotonic() - self.checked_at >= self.version_check_interval:
+            # Set before awaiting, so concurrent requests don't check again
+            self.checked_at = time.monotonic()
+            self.version = await self.r.get(VERSION_KEY)
+        return self.version
+
+    def key(self, request: bytes, model_directory: str, version: bytes) -> bytes:
+        """Key of a request: hash of its canonical encoding, of the model and
+        of the venue data version. Drop the entries of another model or version.
+
+        Args:
+            request (bytes): canonical encoding of the request
+            model_directory (str): directory of the model scoring the request
+            version (bytes): version of the venue data
+
+        Returns:
+            bytes: key of the request
+        """
+        scope = (model_directory, version)
+        if scope != self.scope:
+            self.clear()
+            self.scope = scope
+        digest = hashlib.blake2b(request, digest_size=16)
+        digest.update(b"\0" + model_directory.encode() + b"\0" + version)
+        return digest.digest()
+
+    async def get(self, key: bytes) -> bytes | None:
+        """Return the cached response body of the request, or None"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.remove(key)
+
+        if self.use_redis:
+            body = await self.r.get(RESULT_KEY_PREFIX + key.hex())
+            if body is not None:
+                self.store(key, body)
+                self.redis_hits += 1
+                return body
+        self.misses += 1
+        return None
+
+    def put(self, key: bytes, body: bytes) -> None:
+        """Cache the response body of the request"""
+        self.store(key, body)
+        if self.use_redis:
+            # Written in the background, off the response path
+            task = asyncio.create_task(
+                self.r.set(RESULT_KEY_PREFIX + key.hex(), body, px=int(self.ttl * 1000))
+            )
+            self.pending.add(task)
+            task.add_done_callback(self.pending.discard)
+
+    def store(self, key: bytes, body: bytes) -> None:
+        """Add an in-process entry, evicting the least recently used ones"""
+        size = len(key) + len(body) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        self.remove(key)
+        self.entries[key] = (time.monotonic() + self.ttl, body)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            self.remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def remove(self, key: bytes) -> None:
+        """Remove an in-process entry if it exists"""
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(key) + len(entry[1]) + ENTRY_OVERHEAD
+
+    def clear(self) -> None:
+        """Remove all in-process entries"""
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        """Return the counters of the cache"""
+        total = self.hits + self.redis_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.redis_hits) / total if total else 0.0,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,89 @@
+import pickle
+
+import numpy as np
+
+
+class PickleCodec:
+    """Legacy format: each venue is a pickled Python list of floats"""
+
+    name = "pickle"
+
+    def encode(self, values: list[float]) -> bytes:
+        """Serialize the features of one venue"""
+        return pickle.dumps(values)
+
+    def decode_into(self, blobs: list[bytes], out: np.ndarray) -> None:
+        """Deserialize a batch of venues into the rows of the given array"""
+        out[:] = [pickle.loads(blob) for blob in blobs]
+
+
+class PackedCodec:
+    """Fixed-width format: each venue is a packed little-endian float record,
+    so a batch of records decodes with one join and one np.frombuffer
+    """
+
+    def __init__(self, dtype: str):
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        self.name = self.dtype.name
+
+    def encode(self, values: list[float]) -> bytes:
+        """Serialize the features of one venue"""
+        return np.asarray(values, dtype=self.dtype).tobytes()
+
+    def decode_into(self, blobs: list[bytes], out: np.ndarray) -> None:
+        """Deserialize a batch of venues into the rows of the given array"""
+        out[:] = np.frombuffer(b"".join(blobs), dtype=self.dtype).reshape(out.shape)
+
+
+class DualReadCodec:
+    """Migration format: write with the packed codec,
+    read records written by either the packed or the pickle codec.
+    Records are told apart by their size: a pickled list of floats
+    (9 bytes per float plus framing) never has the size of a packed record.
+    """
+
+    def __init__(self, codec: PackedCodec, n_features: int):
+        self.codec = codec
+        self.fallback = PickleCodec()
+        self.name = codec.name
+        self.record_size = codec.dtype.itemsize * n_features
+
+    def encode(self, values: list[float]) -> bytes:
+        """Serialize the features of one venue"""
+        return self.codec.encode(values)
+
+    def decode_into(self, blobs: list[bytes], out: np.ndarray) -> None:
+        """Deserialize a batch of venues into the rows of the given array"""
+        legacy = [i for i, blob in enumerate(blobs) if len(blob) != self.record_size]
+        if not legacy:
+            self.codec.decode_into(blobs, out)
+            return
+
+        packed = [i for i, blob in enumerate(blobs) if len(blob) == self.record_size]
+        # Fancy indexing returns copies: decode into buffers, then scatter
+        for rows, codec in ((legacy, self.fallback), (packed, self.codec)):
+            buffer = np.empty((len(rows), out.shape[1]), dtype=out.dtype)
+            codec.decode_into([blobs[i] for i in rows], buffer)
+            out[rows] = buffer
+
+
+def get_codec(
+    name: str, n_features: int, dual_read: bool = False
+) -> PickleCodec | PackedCodec | DualReadCodec:
+    """Return the codec of the venue store
+
+    Args:
+        name (str): "pickle", "float32" or "float64"
+        n_features (int): number of features of each venue
+        dual_read (bool): also read records in the pickle format
+
+    Returns:
+        PickleCodec | PackedCodec | DualReadCodec: codec of the venue store
+    """
+    if name == "pickle":
+        return PickleCodec()
+    if name not in ("float32", "float64"):
+        raise ValueError(f"Unknown venue encoding: {name}")
+    if dual_read:
+        return DualReadCodec(PackedCodec(name), n_features)
+    return PackedCodec(name)
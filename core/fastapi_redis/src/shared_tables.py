@@ -0,0 +1,179 @@
+import json
+import os
+
+import numpy as np
+
+# File holding the current generation, memory-mapped by every worker
+GENERATION_FILE = "generation.npy"
+# File written by a worker to ask the parent to publish another model
+REQUESTED_MODEL_FILE = "requested_model"
+
+
+class SharedVenueTables:
+    """Venue feature matrix shared by the workers of the pre-fork server.
+
+    The parent process publishes each version of the venue table, together
+    with the directory of the active model, as a new generation of `.npy`
+    files in `directory`, ideally on a tmpfs such as /dev/shm. The workers
+    memory-map the files read-only, so the table is in memory once whatever
+    the number of workers. Venues are looked up by binary search in the sorted
+    venue ids, so the workers build no per-process index either.
+
+    The current generation number is itself a memory-mapped file: checking
+    it costs one array read per request, and a worker re-attaches as soon as
+    the parent published a new generation.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.generation_file: np.ndarray | None = None
+        # Attached generation, its arrays and metadata
+        self.generation: int = 0
+        self.venue_ids: np.ndarray = np.empty(0, dtype=np.int64)
+        self.matrix: np.ndarray = np.empty((0, 0))
+        self.metadata: dict = {}
+        # Counters
+        self.hits: int = 0
+        self.misses: int = 0
+        self.attaches: int = 0
+
+    def path(self, name: str, generation: int) -> str:
+        """Path of a file of the given generation"""
+        return os.path.join(self.directory, f"{name}_{generation}")
+
+    def publish(self, venue_ids: np.ndarray, matrix: np.ndarray, metadata: dict) -> int:
+        """Write a new generation and make it current. Called by the parent only.
+
+        The files of the previous generation are removed: the workers still
+        attached to it keep their mappings until they re-attach.
+
+        Args:
+            venue_ids (np.ndarray): sorted venue ids
+            matrix (np.ndarray): venue features, one row per venue id
+            metadata (dict): version of the venue data and active model
+
+        Returns:
+            int: new generation
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, GENERATION_FILE)
+        if self.generation_file is None:
+            if not os.path.exists(path):
+                np.save(path, np.zeros(1, dtype=np.int64))
+            self.generation_file = np.load(path, mmap_mode="r+")
+        previous = int(self.generation_file[0])
+        generation = previous + 1
+
+        np.save(self.path("venue_ids", generation) + ".npy", venue_ids)
+        np.save(self.path("venue_features", generation) + ".npy", matrix)
+        with open(self.path("metadata", generation) + ".json", "w") as f:
+            json.dump(metadata, f)
+        # The workers read the files of a generation only once it is current
+        self.generation_file[0] = generation
+        self.generation_file.flush()
+
+        for name in ["venue_ids", "venue_features"]:
+            self.remove(self.path(name, previous) + ".npy")
+        self.remove(self.path("metadata", previous) + ".json")
+        return generation
+
+    @staticmethod
+    def remove(path: str) -> None:
+        """Remove the file if it exists"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def current_generation(self) -> int:
+        """Return the generation last published by the parent"""
+        if self.generation_file is None:
+            self.generation_file = np.load(
+                os.path.join(self.directory, GENERATION_FILE), mmap_mode="r"
+            )
+        return int(self.generation_file[0])
+
+    def refresh(self) -> bool:
+        """Attach the current generation if it is not attached yet
+
+        Returns:
+            bool: whether a new generation was attached
+        """
+        generation = self.current_generation()
+        if generation == self.generation:
+            return False
+        try:
+            venue_ids = np.load(self.path("venue_ids", generation) + ".npy", "r")
+            matrix = np.load(self.path("venue_features", generation) + ".npy", "r")
+            with open(self.path("metadata", generation) + ".json") as f:
+                metadata = json.load(f)
+        except FileNotFoundError:
+            # Already replaced by a newer generation, attach it next time
+            return False
+        # Swap all references at once, readers never see a half-attached table
+        self.venue_ids, self.matrix, self.metadata = venue_ids, matrix, metadata
+        self.generation = generation
+        self.attaches += 1
+        return True
+
+    def get_features(self, venue_ids: list, out: np.ndarray) -> list[int]:
+        """Given the list of venue ids, write the features of the venues of the
+        table into the given array
+
+        Args:
+            venue_ids (list): list of venue ids
+            out (np.ndarray): array of shape (len(venue_ids), n_features)
+
+        Returns:
+            list[int]: positions of the venue ids missing from the table,
+                their rows of `out` are left untouched
+        """
+        table_ids, matrix = self.venue_ids, self.matrix
+        try:
+            ids = np.array(venue_ids, dtype=np.int64)
+        except OverflowError:
+            # Not an int64: no such venue in the table
+            self.misses += len(venue_ids)
+            return list(range(len(venue_ids)))
+
+        rows = np.searchsorted(table_ids, ids)
+        rows[rows == len(table_ids)] = 0
+        found = table_ids[rows] == ids if len(table_ids) else np.zeros(len(ids), bool)
+        out[found] = matrix[rows[found]]
+
+        missing = np.flatnonzero(~found).tolist()
+        self.hits += len(venue_ids) - len(missing)
+        self.misses += len(missing)
+        return missing
+
+    def request_model(self, model_directory: str) -> None:
+        """Ask the parent to publish the table with another active model"""
+        path = os.path.join(self.directory, REQUESTED_MODEL_FILE)
+        with open(path + ".tmp", "w") as f:
+            f.write(model_directory)
+        os.replace(path + ".tmp", path)
+
+    def requested_model(self) -> str | None:
+        """Return and clear the model requested by a worker, if any"""
+        path = os.path.join(self.directory, REQUESTED_MODEL_FILE)
+        try:
+            with open(path) as f:
+                model_directory = f.read()
+        except FileNotFoundError:
+            return None
+        self.remove(path)
+        return model_directory
+
+    def stats(self) -> dict:
+        """Return the counters of the attached table"""
+        total = self.hits + self.misses
+        return {
+            "generation": self.generation,
+            "version": self.metadata.get("version"),
+            "model_directory": self.metadata.get("model_directory"),
+            "venues": len(self.venue_ids),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "attaches": self.attaches,
+        }
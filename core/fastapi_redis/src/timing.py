@@ -0,0 +1,31 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+# Stage durations of the current request, in seconds
+_stages: ContextVar[dict[str, float] | None] = ContextVar("stages", default=None)
+
+
+def start_request() -> dict[str, float]:
+    """Start recording the stage durations of the current request
+
+    Returns:
+        dict[str, float]: stage name -> duration in seconds, filled as
+            the stages of the request complete
+    """
+    stages: dict[str, float] = {}
+    _stages.set(stages)
+    return stages
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Record the duration of a stage of the current request, if recording"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages = _stages.get()
+        if stages is not None:
+            stages[name] = stages.get(name, 0.0) + time.perf_counter() - start
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from benchmark_preprocessing import (
+    reference_session_data_preprocessing,
+    synthetic_sessions,
+)
+from data import session_data_preprocessing
+
+
+def raw_sessions(rows: list[tuple]) -> pd.DataFrame:
+    """Raw session data of (session_id, position_in_list, purchased, has_seen)
+    rows, with the index column of data/sessions.csv"""
+    df = pd.DataFrame(
+        rows,
+        columns=[
+            "session_id",
+            "position_in_list",
+            "purchased",
+            "has_seen_venue_in_this_session",
+        ],
+    )
+    df.insert(2, "venue_id", df["position_in_list"] + 100)
+    df.insert(0, "Unnamed: 0", df.index)
+    return df
+
+
+def test_all_seen():
+    df = raw_sessions([(1, 0, False, True), (1, 1, True, True), (2, 0, True, False)])
+    output = session_data_preprocessing(df)
+    assert output["position_in_list"].tolist() == [0, 1]
+    assert "Unnamed: 0" not in output
+
+
+def test_nan_session_kept_up_to_purchase():
+    df = raw_sessions(
+        [(1, 0, False, np.nan), (1, 1, True, np.nan), (1, 2, False, np.nan)]
+    )
+    output = session_data_preprocessing(df)
+    assert output["position_in_list"].tolist() == [0, 1]
+
+
+def test_nan_session_without_purchase_dropped():
+    df = raw_sessions(
+        [(1, 0, False, np.nan), (1, 1, False, np.nan), (2, 0, True, True)]
+    )
+    output = session_data_preprocessing(df)
+    assert output["session_id"].tolist() == [2]
+
+
+def test_duplicated_rows_dropped():
+    df = raw_sessions([(1, 0, True, True), (1, 0, True, True)])
+    assert len(session_data_preprocessing(df)) == 1
+
+
+def test_same_output_as_reference():
+    session_df = synthetic_sessions(500)
+    pd.testing.assert_frame_equal(
+        session_data_preprocessing(session_df.copy()),
+        reference_session_data_preprocessing(session_df.copy()),
+    )
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from benchmark_ranking import reference_ranking_order
+from ranking import PARTIAL_SELECTION_MIN_CANDIDATES, ranking_order
+
+
+def test_ties_keep_request_order():
+    scores = np.array([0.2, 0.9, 0.5, 0.9, 0.5])
+    assert ranking_order(scores).tolist() == [1, 3, 2, 4, 0]
+    assert ranking_order(scores, top_k=3).tolist() == [1, 3, 2]
+
+
+def test_ties_straddling_the_cut_of_a_long_list():
+    # Long enough for the partial selection: the earliest tied venues are kept
+    scores = np.zeros(PARTIAL_SELECTION_MIN_CANDIDATES * 2)
+    scores[[5, 700]] = 1.0
+    assert ranking_order(scores, top_k=4).tolist() == [5, 700, 0, 1]
+
+
+def test_threshold_and_mask():
+    scores = np.array([0.2, 0.9, 0.5, 0.9, 0.5])
+    mask = np.array([True, False, True, True, True])
+    assert ranking_order(scores, score_threshold=0.5).tolist() == [1, 3, 2, 4]
+    assert ranking_order(scores, top_k=2, mask=mask).tolist() == [3, 2]
+    assert ranking_order(scores, score_threshold=0.95).tolist() == []
+
+
+@pytest.mark.parametrize("n", [0, 1, 40, PARTIAL_SELECTION_MIN_CANDIDATES * 3])
+def test_same_order_as_full_sort(n):
+    rng = np.random.default_rng(n)
+    for _ in range(50):
+        # Few distinct scores, so that ties straddle the K-th position
+        scores = rng.integers(0, 5, n) / 4
+        top_k = int(rng.integers(1, n + 10)) if rng.random() < 0.8 else None
+        threshold = float(rng.choice([0.25, 0.5, 1.0])) if rng.random() < 0.3 else None
+        mask = rng.random(n) < 0.8 if rng.random() < 0.3 else None
+        np.testing.assert_array_equal(
+            ranking_order(scores, top_k, threshold, mask),
+            reference_ranking_order(scores, top_k, threshold, mask),
+        )
@@ -0,0 +1,161 @@
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from log_store import LogStore, format_time, query, read_index, select_segments
+
+LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+LEVEL_WEIGHTS = [30, 55, 12, 2.9, 0.1]
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        description="Measure the ingest and query throughput of the log store "
+        "against a plain text log file"
+    )
+    parser.add_argument("--records", type=int, default=500000)
+    parser.add_argument("--hours", type=float, default=24.0, help="Logged period.")
+    parser.add_argument("--loggers", type=int, default=20, help="App containers.")
+    parser.add_argument(
+        "--segment-bytes", type=int, default=4 * 1024 * 1024, help="Segment size."
+    )
+    parser.add_argument(
+        "--chunk-bytes", type=int, default=64 * 1024, help="Size of the batches."
+    )
+    parser.add_argument("--directory", default=None, help="A temporary one by default.")
+    parser.add_argument("--seed", type=int, default=42)
+
+    return parser.parse_args(argv)
+
+
+def make_batches(args):
+    """Log lines formatted like main.py over the logged period, in batches of
+    datagrams of about chunk_bytes."""
+    rng = random.Random(args.seed)
+    start = time.mktime((2023, 6, 5, 0, 0, 0, 0, 0, -1))
+    step = args.hours * 3600 / args.records
+    levels = rng.choices(LEVELS, LEVEL_WEIGHTS, k=args.records)
+    batches, batch, size = [], [], 0
+    for i in range(args.records):
+        line = "{} {:<12} {:<8} request {} handled in {:.1f} ms".format(
+            format_time(start + i * step),
+            "app-{}".format(rng.randrange(args.loggers)),
+            levels[i],
+            rng.randrange(10**6),
+            rng.expovariate(0.1),
+        ).encode()
+        batch.append(line)
+        size += len(line) + 1
+        if size >= args.chunk_bytes:
+            batches.append(batch)
+            batch, size = [], 0
+    if batch:
+        batches.append(batch)
+    return batches, start
+
+
+def grep_text(path, since, until, level, logger):
+    """Filter the plain text log file line by line, as grep would."""
+    matches = 0
+    rank = LEVELS.index(level) if level else None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            fields = line.split(None, 4)
+            time_ = fields[0] + " " + fields[1]
+            if since is not None and time_ < since:
+                continue
+            if until is not None and time_ >= until:
+                continue
+            if rank is not None and LEVELS.index(fields[3]) < rank:
+                continue
+            if logger is not None and fields[2] != logger:
+                continue
+            matches += 1
+    return matches
+
+
+def main(args):
+    directory = args.directory or tempfile.mkdtemp(prefix="log_store_")
+    store_directory = os.path.join(directory, "store")
+    text_path = os.path.join(directory, "logfile.txt")
+    try:
+        batches, start = make_batches(args)
+        text_bytes = sum(len(line) + 1 for batch in batches for line in batch)
+
+        started = time.perf_counter()
+        with open(text_path, "wb") as f:
+            for batch in batches:
+                f.write(b"\n".join(batch) + b"\n")
+        text_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        store = LogStore(store_directory, segment_bytes=args.segment_bytes)
+        for batch in batches:
+            store.write(batch)
+        store.close()
+        store_seconds = time.perf_counter() - started
+
+        index = read_index(store_directory)
+        store_bytes = sum(
+            os.path.getsize(os.path.join(store_directory, name))
+            for name in os.listdir(store_directory)
+        )
+        print(
+            "Ingest {} records, {:.1f} MB of text".format(
+                args.records, text_bytes / 1e6
+            )
+        )
+        print("  text file: {:.0f} records/s".format(args.records / text_seconds))
+        print(
+            "  log store: {:.0f} records/s, {:.1f} MB in {} segments, "
+            "compression ratio {:.1f}".format(
+                args.records / store_seconds,
+                store_bytes / 1e6,
+                len(index),
+                text_bytes / store_bytes,
+            )
+        )
+
+        hour = format_time(start + args.hours * 3600 / 2)[:13]
+        next_hour = format_time(start + args.hours * 3600 / 2 + 3600)[:13]
+        queries = [
+            ("errors of app-0 in one hour", hour, next_hour, "ERROR", "app-0"),
+            ("all logs of one hour", hour, next_hour, None, None),
+            ("critical logs of the day", None, None, "CRITICAL", None),
+            ("errors of the day", None, None, "ERROR", None),
+        ]
+        for name, since, until, level, logger in queries:
+            started = time.perf_counter()
+            expected = grep_text(text_path, since, until, level, logger)
+            grep_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            entries = select_segments(index, since, until, level, logger)
+            matches = sum(
+                1 for _ in query(store_directory, entries, since, until, level, logger)
+            )
+            query_seconds = time.perf_counter() - started
+
+            assert matches == expected, (name, matches, expected)
+            print(
+                "Query {}: {} records, {} of {} segments read in {:.3f}s, "
+                "text file scanned in {:.3f}s".format(
+                    name,
+                    matches,
+                    len(entries),
+                    len(index),
+                    query_seconds,
+                    grep_seconds,
+                )
+            )
+    finally:
+        if args.directory is None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(parse_arguments(sys.argv[1:]))
@@ -1,11 +1,23 @@
 import argparse
+import asyncio
+import json
+import multiprocessing
 import os
+import select
+import signal
 import socket
 import sys
+import time
 
+from log_store import LogStore
+
+# Largest UDP payload over IPv4
+MAX_DATAGRAM = 65507
+# Datagrams read per wake-up of the event loop, before letting the flusher run
+MAX_READS = 1000
 
-def parse_arguments(argv):
 
+def parse_arguments(argv):
     parser = argparse.ArgumentParser(description="Print Logs")
     parser.add_argument(
         "--save",
@@ -20,37 +32,438 @@ def parse_arguments(argv):
         help="Set flag not to save logs to text file.",
     )
     parser.set_defaults(save=True)
+    parser.add_argument(
+        "--print",
+        dest="echo",
+        action="store_true",
+        help="Set flag to print logs to stdout (default).",
+    )
+    parser.add_argument(
+        "--no-print",
+        dest="echo",
+        action="store_false",
+        help="Set flag not to print logs to stdout.",
+    )
+    parser.set_defaults(echo=True)
     parser.add_argument(
         "--port", default=5091, help="Use flag to specify logger port (default 5091)."
     )
+    parser.add_argument(
+        "--log-file", default="logfile.txt", help="Log file (default logfile.txt)."
+    )
+    parser.add_argument(
+        "--flush-bytes",
+        type=int,
+        default=64 * 1024,
+        help="Write the queued logs once they reach this size (default 64KiB).",
+    )
+    parser.add_argument(
+        "--flush-interval",
+        type=float,
+        default=0.5,
+        help="Write the queued logs at least every this many seconds (default 0.5).",
+    )
+    parser.add_argument(
+        "--fsync",
+        choices=["never", "batch", "rotate"],
+        default="never",
+        help="Force the log file to disk: never (leave it to the OS, default), "
+        "after every batch, or when a file is complete (rotation and shutdown).",
+    )
+    parser.add_argument(
+        "--max-bytes",
+        type=int,
+        default=10 * 1024 * 1024,
+        help="Rotate the log file once it reaches this size, 0 to never rotate "
+        "(default 10MiB).",
+    )
+    parser.add_argument(
+        "--backup-count",
+        type=int,
+        default=5,
+        help="Rotated log files to keep: logfile.txt.1 is the most recent "
+        "(default 5).",
+    )
+    parser.add_argument(
+        "--store",
+        default=None,
+        help="Also store the logs compressed and indexed in this directory, "
+        "to query them with log_store.py.",
+    )
+    parser.add_argument(
+        "--segment-bytes",
+        type=int,
+        default=16 * 1024 * 1024,
+        help="Start a new segment of the store after this many uncompressed "
+        "bytes (default 16MiB).",
+    )
+    parser.add_argument(
+        "--segment-seconds",
+        type=float,
+        default=60.0,
+        help="Start a new segment of the store after this many seconds: the "
+        "logs can be queried once their segment is complete (default 60).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes receiving the logs, each binding the port with "
+        "SO_REUSEPORT: worker i writes logfile-i.txt and the store "
+        "logs/worker-i (default 1).",
+    )
+    parser.add_argument(
+        "--rcvbuf",
+        type=int,
+        default=None,
+        help="Receive buffer of the sockets in bytes, capped by "
+        "net.core.rmem_max (default: the system default).",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=60.0,
+        help="Print the counters of the workers every this many seconds, "
+        "0 to only print them on exit (default 60).",
+    )
 
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 
-def spin_up_log_server(udp_ip, udp_port, save=False):
-    """Spin up local udp log server."""
+def write_lines(stream, chunk):
+    """Write the lines to the stream with writes of at most PIPE_BUF bytes,
+    split between lines, so that the lines of several workers writing to the
+    same pipe never mix."""
+    stream.flush()
+    fd = stream.fileno()
+    start = 0
+    while start < len(chunk):
+        end = chunk.rfind(b"\n", start, start + select.PIPE_BUF) + 1
+        if end <= start:
+            # A line longer than PIPE_BUF, written alone
+            end = chunk.find(b"\n", start + select.PIPE_BUF) + 1 or len(chunk)
+        view = memoryview(chunk)[start:end]
+        while view:
+            view = view[os.write(fd, view) :]
+        start = end
+
+
+class BatchedLogWriter:
+    """Queue the log records and write them in batches.
+
+    The records are kept as bytes and joined into one chunk per batch, which is
+    written through one long-lived file handle and one stdout write. A batch is
+    written once the queued records reach `flush_bytes`, or by the periodic
+    flush every `flush_interval` seconds, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        path,
+        save=True,
+        echo=True,
+        flush_bytes=64 * 1024,
+        flush_interval=0.5,
+        fsync="never",
+        max_bytes=10 * 1024 * 1024,
+        backup_count=5,
+        store=None,
+    ):
+        self.path = path
+        self.save = save
+        self.echo = echo
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.store = store
+        self.records = []
+        self.queued_bytes = 0
+        self.file = None
+        self.size = 0
+        if save:
+            # Start a new log file on every run, as before
+            self.file = open(path, "wb")
+        # Counters
+        self.received = 0
+        self.written = 0
+        self.batches = 0
+        self.rotations = 0
+
+    def append(self, data):
+        """Queue one log record."""
+        self.records.append(data)
+        self.queued_bytes += len(data) + 1
+        self.received += 1
+        if self.queued_bytes >= self.flush_bytes:
+            self.flush()
+
+    def flush(self):
+        """Write the queued records, one per line."""
+        if not self.records:
+            return
+        records = self.records
+        chunk = b"\n".join(records) + b"\n"
+        self.records = []
+        self.queued_bytes = 0
+        self.batches += 1
+
+        if self.echo:
+            write_lines(sys.stdout, chunk)
+        if self.file is not None:
+            if self.max_bytes and self.size and self.size + len(chunk) > self.max_bytes:
+                self.rotate()
+            self.file.write(chunk)
+            self.file.flush()
+            self.size += len(chunk)
+            if self.fsync == "batch":
+                os.fsync(self.file.fileno())
+        if self.store is not None:
+            self.store.write(records)
+        self.written += len(records)
+
+    def rotate(self):
+        """Rename logfile.txt to logfile.txt.1, logfile.txt.1 to logfile.txt.2...
+        and start a new log file."""
+        self.close_file()
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                source = "{}.{}".format(self.path, i)
+                if os.path.exists(source):
+                    os.replace(source, "{}.{}".format(self.path, i + 1))
+            os.replace(self.path, self.path + ".1")
+        self.file = open(self.path, "wb")
+        self.size = 0
+        self.rotations += 1
+
+    def close_file(self):
+        """Close the log file, forcing it to disk unless fsync is never."""
+        if self.fsync != "never":
+            os.fsync(self.file.fileno())
+        self.file.close()
+
+    async def run_flusher(self):
+        """Write the queued records every flush_interval seconds."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+            if self.store is not None:
+                self.store.seal_expired()
+
+    def close(self):
+        """Write the queued records and close the log file."""
+        self.flush()
+        if self.file is not None:
+            self.close_file()
+            self.file = None
+        if self.store is not None:
+            self.store.close()
+
+
+class LogServerProtocol(asyncio.DatagramProtocol):
+    """Hand every datagram over to the writer, without decoding it."""
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def datagram_received(self, data, addr):
+        self.writer.append(data)
+
+    def error_received(self, exc):
+        print("Log server error: {}".format(exc), file=sys.stderr)
+
+
+def read_datagrams(sock, protocol):
+    """Receive all datagrams waiting in the socket buffer.
+
+    The datagram transport of asyncio receives one datagram per wake-up of the
+    event loop: draining the buffer instead keeps up with bursts of logs.
+    """
+    for _ in range(MAX_READS):
+        try:
+            data, addr = sock.recvfrom(MAX_DATAGRAM)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as exc:
+            protocol.error_received(exc)
+            return
+        protocol.datagram_received(data, addr)
+
+
+def bind_socket(udp_ip, udp_port, rcvbuf=None, reuse_port=False):
+    """Bind a UDP socket, with a receive buffer of rcvbuf bytes if given."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if reuse_port:
+        # Each worker binds the port, the kernel spreads the senders among them
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    sock.bind((udp_ip, udp_port))
+    sock.setblocking(False)
+    return sock
+
+
+def socket_drops(sock):
+    """Datagrams dropped by the kernel because the receive buffer of the socket
+    was full, from /proc/net/udp. None if not available."""
+    inode = str(os.fstat(sock.fileno()).st_ino)
     try:
-        os.remove("logfile.txt")
-    except Exception as e:
+        with open("/proc/net/udp") as f:
+            for line in f:
+                fields = line.split()
+                if fields[9] == inode:
+                    return int(fields[12])
+    except (OSError, IndexError, ValueError):
         pass
+    return None
 
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # Internet  # UDP
-    sock.bind((udp_ip, udp_port))
+
+def worker_stats(sock, writer, worker):
+    """Counters of a worker, in datagrams."""
+    return {
+        "worker": worker,
+        "received": writer.received,
+        "written": writer.written,
+        "dropped": socket_drops(sock),
+        "rcvbuf": sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF),
+    }
+
+
+async def report_stats(sock, writer, worker, interval):
+    """Print the counters of the worker every interval seconds."""
     while True:
-        # buffer size is 1024 bytes
-        data = sock.recvfrom(1024)[0]
-        print(data.decode("utf-8"))
-        # write logs to file
-        if save:
-            with open("logfile.txt", "a") as log_file:
-                log_file.write(data.decode("utf-8") + "\n")
+        await asyncio.sleep(interval)
+        print(json.dumps(worker_stats(sock, writer, worker)), file=sys.stderr)
 
 
-if __name__ == "__main__":
+async def serve(sock, writer, worker=0, stats_interval=60.0):
+    """Receive the logs until SIGINT or SIGTERM, then write the queued ones."""
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    protocol = LogServerProtocol(writer)
+    loop.add_reader(sock.fileno(), read_datagrams, sock, protocol)
+    tasks = [asyncio.ensure_future(writer.run_flusher())]
+    if stats_interval:
+        tasks.append(
+            asyncio.ensure_future(report_stats(sock, writer, worker, stats_interval))
+        )
+    try:
+        await stop.wait()
+    finally:
+        for task in tasks:
+            task.cancel()
+        loop.remove_reader(sock.fileno())
+        writer.close()
+        print(json.dumps(worker_stats(sock, writer, worker)), file=sys.stderr)
+        sock.close()
 
+
+def spin_up_log_server(sock, writer, worker=0, stats_interval=60.0):
+    """Spin up local udp log server."""
+    asyncio.run(serve(sock, writer, worker, stats_interval))
+
+
+def create_writer(args, worker=None):
+    """Create the writer of the logs, of the given worker: each worker writes
+    its own log file and store, such as logfile-0.txt and logs/worker-0."""
+    log_file, store_directory = args.log_file, args.store
+    if worker is not None:
+        root, ext = os.path.splitext(log_file)
+        log_file = "{}-{}{}".format(root, worker, ext)
+        if store_directory:
+            store_directory = os.path.join(store_directory, "worker-{}".format(worker))
+
+    store = None
+    if store_directory:
+        store = LogStore(
+            store_directory,
+            segment_bytes=args.segment_bytes,
+            segment_seconds=args.segment_seconds,
+        )
+    return BatchedLogWriter(
+        log_file,
+        save=args.save,
+        echo=args.echo,
+        flush_bytes=args.flush_bytes,
+        flush_interval=args.flush_interval,
+        fsync=args.fsync,
+        max_bytes=args.max_bytes,
+        backup_count=args.backup_count,
+        store=store,
+    )
+
+
+def run_worker(args, socks, worker):
+    """Receive the logs of the socket of the worker, in a worker process."""
+    # The worker installs its own handlers for a graceful shutdown
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    for i, sock in enumerate(socks):
+        if i != worker:
+            sock.close()
+    spin_up_log_server(
+        socks[worker], create_writer(args, worker), worker, args.stats_interval
+    )
+
+
+def start_worker(args, socks, worker):
+    """Start the process of the worker, which inherits the sockets by forking."""
+    process = multiprocessing.get_context("fork").Process(
+        target=run_worker, args=(args, socks, worker), name="worker-{}".format(worker)
+    )
+    process.start()
+    return process
+
+
+def run_workers(args, udp_ip, udp_port):
+    """Receive the logs with args.workers processes until SIGINT or SIGTERM.
+
+    The sockets are bound by the parent, each with SO_REUSEPORT: the kernel
+    sends the datagrams of a sender to the same worker, and spreads the senders
+    among the workers. A worker which dies is restarted on the same socket.
+    """
+    socks = [
+        bind_socket(udp_ip, udp_port, args.rcvbuf, reuse_port=True)
+        for _ in range(args.workers)
+    ]
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    workers = [start_worker(args, socks, i) for i in range(args.workers)]
+    while not stopping:
+        time.sleep(0.1)
+        for worker, process in enumerate(workers):
+            if not process.is_alive() and not stopping:
+                print("Worker {} exited, restarting it".format(worker), file=sys.stderr)
+                workers[worker] = start_worker(args, socks, worker)
+
+    for process in workers:
+        process.terminate()
+    for process in workers:
+        process.join()
+
+
+if __name__ == "__main__":
     args = parse_arguments(sys.argv[1:])
 
     UDP_PORT = int(args.port)
     UDP_IP = "0.0.0.0"
 
-    spin_up_log_server(UDP_IP, UDP_PORT, args.save)
+    if args.workers > 1:
+        run_workers(args, UDP_IP, UDP_PORT)
+    else:
+        spin_up_log_server(
+            bind_socket(UDP_IP, UDP_PORT, args.rcvbuf),
+            create_writer(args),
+            stats_interval=args.stats_interval,
+        )
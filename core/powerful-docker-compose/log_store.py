@@ -0,0 +1,371 @@
+import argparse
+import gzip
+import heapq
+import json
+import os
+import re
+import sys
+import time
+import zlib
+from collections import Counter
+
+# Records formatted by main.py with
+# "%(asctime)s %(name)-12s %(levelname)-8s %(message)s"
+RECORD_PATTERN = re.compile(
+    r"(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) (\S+) +([A-Z]+) (.*)"
+)
+SEGMENT_PATTERN = re.compile(r"segment_(\d+)\.jsonl\.gz")
+WORKER_PATTERN = re.compile(r"worker-\d+")
+INDEX_FILE = "index.jsonl"
+COLUMNS = ["time", "logger", "level", "message"]
+LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        description="Query the logs stored by log_server.py --store"
+    )
+    parser.add_argument(
+        "directory",
+        help="Directory of the log store, or of the stores of the workers.",
+    )
+    parser.add_argument(
+        "--since", help='Only the logs from this time on, such as "2023-06-05 10:00".'
+    )
+    parser.add_argument(
+        "--until", help='Only the logs before this time, such as "2023-06-05 11".'
+    )
+    parser.add_argument(
+        "--level",
+        type=str.upper,
+        choices=LEVELS,
+        help="Only the logs of this level or above.",
+    )
+    parser.add_argument("--logger", help="Only the logs of this logger.")
+    parser.add_argument("--grep", help="Only the logs whose message contains this.")
+    parser.add_argument(
+        "--json", action="store_true", help="Print the logs as JSON lines."
+    )
+
+    return parser.parse_args(argv)
+
+
+def format_time(timestamp):
+    """Format the timestamp like the asctime of the log records."""
+    return time.strftime(
+        "%Y-%m-%d %H:%M:%S", time.localtime(timestamp)
+    ) + ",{:03d}".format(int(timestamp % 1 * 1000))
+
+
+def level_rank(level):
+    """Rank of the level among LEVELS, -1 for other levels."""
+    try:
+        return LEVELS.index(level)
+    except ValueError:
+        return -1
+
+
+def parse_records(datagram, received=None):
+    """Parse the log lines of a datagram into records, lists of time, logger,
+    level and message.
+
+    The lines which do not start with a time, logger and level, such as the
+    lines of a traceback, continue the message of the previous record of the
+    datagram. Lines not following a record make records of their own, timed at
+    reception.
+    """
+    records = []
+    for line in datagram.decode("utf-8", "replace").splitlines():
+        match = RECORD_PATTERN.fullmatch(line)
+        if match:
+            time_, logger, level, message = match.groups()
+            # The level is padded to 8 characters
+            records.append([time_, logger, level, message[max(0, 8 - len(level)) :]])
+        elif records and records[-1][2]:
+            records[-1][3] += "\n" + line
+        elif line:
+            records.append([format_time(received or time.time()), "", "", line])
+    return records
+
+
+def new_entry(segment):
+    """Index entry of an empty segment."""
+    return {
+        "segment": segment,
+        "start": None,
+        "end": None,
+        "records": 0,
+        "bytes": 0,
+        "levels": {},
+        "loggers": {},
+    }
+
+
+def add_to_entry(entry, block):
+    """Count the records of the block in the index entry of its segment."""
+    start, end = min(block["time"]), max(block["time"])
+    if entry["start"] is None or start < entry["start"]:
+        entry["start"] = start
+    if entry["end"] is None or end > entry["end"]:
+        entry["end"] = end
+    entry["records"] += len(block["time"])
+    for column, counts in [("level", entry["levels"]), ("logger", entry["loggers"])]:
+        for value, count in Counter(block[column]).items():
+            counts[value] = counts.get(value, 0) + count
+
+
+def read_blocks(path):
+    """Yield the blocks of records of a segment, up to the end of a truncated
+    one."""
+    with gzip.open(path, "rb") as f:
+        try:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Last line of a truncated segment
+                    return
+        except (EOFError, zlib.error):
+            return
+
+
+def read_index(directory):
+    """Read the index entries of the sealed segments."""
+    try:
+        with open(os.path.join(directory, INDEX_FILE)) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+class LogStore:
+    """Compressed, segmented store of the log records, indexed by time, level
+    and logger.
+
+    Each batch of records is written as one line of JSON to a gzip segment,
+    stored by column: the lists of their times, loggers, levels and messages.
+    The segments are sealed once they reach `segment_bytes` uncompressed bytes
+    or after `segment_seconds`. Each
+    sealed segment gets a line in index.jsonl with the time range of its
+    records and their counts by level and logger, so that a query only reads
+    the segments which can match. Records become queryable once their segment
+    is sealed.
+    """
+
+    def __init__(
+        self,
+        directory,
+        segment_bytes=16 * 1024 * 1024,
+        segment_seconds=60.0,
+        compresslevel=6,
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.compresslevel = compresslevel
+        os.makedirs(directory, exist_ok=True)
+        self.index = read_index(directory)
+        self.recover()
+        numbers = [
+            int(SEGMENT_PATTERN.fullmatch(entry["segment"]).group(1))
+            for entry in self.index
+        ]
+        self.number = max(numbers, default=0) + 1
+        # Open segment
+        self.file = None
+        self.entry = None
+        self.opened_at = 0.0
+
+    def recover(self):
+        """Index the segments left unsealed by a crash."""
+        indexed = {entry["segment"] for entry in self.index}
+        for name in sorted(os.listdir(self.directory)):
+            if SEGMENT_PATTERN.fullmatch(name) and name not in indexed:
+                entry = new_entry(name)
+                for block in read_blocks(os.path.join(self.directory, name)):
+                    add_to_entry(entry, block)
+                    entry["bytes"] += len(json.dumps(block, ensure_ascii=False)) + 1
+                self.append_to_index(entry)
+
+    def append_to_index(self, entry):
+        """Add the entry of a sealed segment to the index."""
+        with open(os.path.join(self.directory, INDEX_FILE), "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        self.index.append(entry)
+
+    def write(self, datagrams):
+        """Store the records of the received datagrams."""
+        received = time.time()
+        records = []
+        for datagram in datagrams:
+            records += parse_records(datagram, received)
+        if not records:
+            return
+        if self.file is None:
+            name = "segment_{:08d}.jsonl.gz".format(self.number)
+            self.file = gzip.open(
+                os.path.join(self.directory, name), "wb", self.compresslevel
+            )
+            self.entry = new_entry(name)
+            self.opened_at = time.monotonic()
+
+        block = dict(zip(COLUMNS, map(list, zip(*records))))
+        add_to_entry(self.entry, block)
+        data = (json.dumps(block, ensure_ascii=False) + "\n").encode("utf-8")
+        self.file.write(data)
+        # Flush the compressor too, so that a crash loses no written record
+        self.file.flush()
+        self.entry["bytes"] += len(data)
+        if self.entry["bytes"] >= self.segment_bytes:
+            self.seal()
+
+    def seal_expired(self):
+        """Seal the open segment if it is older than segment_seconds."""
+        if (
+            self.file is not None
+            and time.monotonic() - self.opened_at >= self.segment_seconds
+        ):
+            self.seal()
+
+    def seal(self):
+        """Close the open segment and add it to the index."""
+        self.file.close()
+        self.append_to_index(self.entry)
+        self.file = None
+        self.entry = None
+        self.number += 1
+
+    def close(self):
+        """Seal the open segment, if any."""
+        if self.file is not None:
+            self.seal()
+
+
+def store_directories(directory):
+    """Directories of the log stores in the directory: itself, and the stores
+    of the workers of log_server.py --workers, such as worker-0."""
+    workers = [
+        os.path.join(directory, name)
+        for name in sorted(os.listdir(directory))
+        if WORKER_PATTERN.fullmatch(name)
+    ]
+    if workers and not os.path.exists(os.path.join(directory, INDEX_FILE)):
+        return workers
+    return [directory] + workers
+
+
+def select_segments(index, since=None, until=None, level=None, logger=None):
+    """Index entries of the segments which can hold matching records."""
+    rank = level_rank(level) if level else None
+    selected = []
+    for entry in index:
+        if not entry["records"]:
+            continue
+        if since is not None and entry["end"] < since:
+            continue
+        if until is not None and entry["start"] >= until:
+            continue
+        if rank is not None and all(
+            level_rank(name) < rank for name in entry["levels"]
+        ):
+            continue
+        if logger is not None and logger not in entry["loggers"]:
+            continue
+        selected.append(entry)
+    return selected
+
+
+def query(
+    directory, entries, since=None, until=None, level=None, logger=None, grep=None
+):
+    """Yield the records of the segments matching all the filters, in time
+    order.
+
+    The segments are read by start time. The time ranges of the segments may
+    overlap, so the records are held in a heap until no later segment can hold
+    an earlier record: only the records of the overlapping segments are kept in
+    memory.
+
+    Times compare as strings, so that "2023-06-05 10" stands for 10 o'clock.
+
+    Args:
+        directory: directory of the log store
+        entries: index entries of the segments to read, from select_segments
+        since: only the records from this time on
+        until: only the records before this time
+        level: only the records of this level or above
+        logger: only the records of this logger
+        grep: only the records whose message contains this
+    """
+    levels = set(LEVELS[level_rank(level) :]) if level else None
+    # Records as (time, rank of the record, record): equal times keep the order
+    # in which they were stored
+    heap = []
+    rank = 0
+    for entry in sorted(entries, key=lambda entry: entry["start"]):
+        # No record of this segment or of the next ones is earlier than this
+        while heap and heap[0][0] < entry["start"]:
+            yield heapq.heappop(heap)[2]
+        for block in read_blocks(os.path.join(directory, entry["segment"])):
+            # Filter the rows column by column
+            times = block["time"]
+            rows = range(len(times))
+            if since is not None:
+                rows = [i for i in rows if times[i] >= since]
+            if until is not None:
+                rows = [i for i in rows if times[i] < until]
+            if levels is not None:
+                column = block["level"]
+                rows = [i for i in rows if column[i] in levels]
+            if logger is not None:
+                column = block["logger"]
+                rows = [i for i in rows if column[i] == logger]
+            if grep is not None:
+                column = block["message"]
+                rows = [i for i in rows if grep in column[i]]
+            for i in rows:
+                record = {name: block[name][i] for name in COLUMNS}
+                heapq.heappush(heap, (times[i], rank, record))
+                rank += 1
+    while heap:
+        yield heapq.heappop(heap)[2]
+
+
+def main(args):
+    # Merge the records of the stores of the workers in time order
+    streams = []
+    for directory in store_directories(args.directory):
+        index = read_index(directory)
+        entries = select_segments(
+            index, args.since, args.until, args.level, args.logger
+        )
+        print(
+            "Reading {} of {} segments of {}".format(
+                len(entries), len(index), directory
+            ),
+            file=sys.stderr,
+        )
+        streams.append(
+            query(
+                directory,
+                entries,
+                args.since,
+                args.until,
+                args.level,
+                args.logger,
+                args.grep,
+            )
+        )
+    for record in heapq.merge(*streams, key=lambda record: record["time"]):
+        if args.json:
+            print(json.dumps(record, ensure_ascii=False))
+        else:
+            print(
+                "{} {:<12} {:<8} {}".format(
+                    record["time"], record["logger"], record["level"], record["message"]
+                )
+            )
+
+
+if __name__ == "__main__":
+    main(parse_arguments(sys.argv[1:]))
@@ -1,7 +1,12 @@
 import logging
 import logging.handlers
+import queue
 import socket
 
+# Largest UDP payload sent without fragmentation over Ethernet: 1500 bytes of MTU
+# minus the IPv4 and UDP headers
+MAX_DATAGRAM = 1472
+
 
 class LogUDPHandler(logging.handlers.SysLogHandler):
     """Class to log UDP Handler."""
@@ -32,20 +37,152 @@ class LogUDPHandler(logging.handlers.SysLogHandler):
             self.handleError(record)
 
 
+class BatchingUDPHandler(LogUDPHandler):
+    """UDP handler packing the records into datagrams of up to `max_datagram`
+    bytes, one record per line. The datagram is sent once the next record does
+    not fit, or on flush."""
+
+    def __init__(self, address, max_datagram=MAX_DATAGRAM):
+        super().__init__(address=address)
+        self.max_datagram = max_datagram
+        self.batch = []
+        self.batch_bytes = 0
+        # Counters
+        self.sent = 0
+        self.datagrams = 0
+        self.failed = 0
+
+    def emit(self, record):
+        """Add the formatted record to the batch."""
+        try:
+            msg = self.format(record).encode("utf-8")
+        except Exception:
+            self.handleError(record)
+            return
+        if self.batch and self.batch_bytes + 1 + len(msg) > self.max_datagram:
+            self.send_batch()
+        self.batch_bytes += len(msg) + (1 if self.batch else 0)
+        self.batch.append(msg)
+
+    def send_batch(self):
+        """Send the batch as one datagram."""
+        records = len(self.batch)
+        msg = b"\n".join(self.batch)
+        self.batch = []
+        self.batch_bytes = 0
+        try:
+            self.socket.sendto(msg, self.address)
+            self.sent += records
+            self.datagrams += 1
+        except OSError:
+            # The log server is unreachable: drop the batch
+            self.failed += records
+
+    def flush(self):
+        """Send the batch, if any."""
+        self.acquire()
+        try:
+            if self.batch:
+                self.send_batch()
+        finally:
+            self.release()
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler which never blocks the application thread.
+
+    The records are queued as they are, and formatted by the listener thread:
+    do not modify the arguments of a log call after it. Beyond `queue_size`
+    queued records, the oldest queued record ("drop-oldest") or the new one
+    ("drop-newest") is dropped, and counted in `dropped`.
+    """
+
+    def __init__(self, queue_size=10000, policy="drop-oldest"):
+        if policy not in ("drop-oldest", "drop-newest"):
+            raise ValueError("Unknown policy: {}".format(policy))
+        super().__init__(queue.Queue(queue_size))
+        self.policy = policy
+        self.dropped = 0
+
+    def prepare(self, record):
+        """Leave the formatting to the listener thread."""
+        return record
+
+    def enqueue(self, record):
+        """Queue the record, dropping a record if the queue is full."""
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                if self.policy == "drop-newest":
+                    self.dropped += 1
+                    return
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """Queue listener flushing its handlers whenever the queue is empty, so
+    that records are batched under load and sent right away otherwise."""
+
+    def dequeue(self, block):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            for handler in self.handlers:
+                handler.flush()
+            return self.queue.get(block)
+
+    def enqueue_sentinel(self):
+        # Wait for room in the queue rather than dropping the sentinel
+        self.queue.put(self._sentinel)
+
+    def stop(self):
+        super().stop()
+        for handler in self.handlers:
+            handler.flush()
+
+
 logging.raiseExceptions = True
 logger = logging.getLogger("logger")
 logger.setLevel(logging.DEBUG)
 
 host, port = "log_server", 5237
-logHandler = LogUDPHandler(address=(host, port))
+udpHandler = BatchingUDPHandler(address=(host, port))
 # Set log format
 formatter = logging.Formatter("%(asctime)s %(name)-12s %(levelname)-8s %(message)s")
-logHandler.setFormatter(formatter)
+udpHandler.setFormatter(formatter)
+udpHandler.setLevel(logging.DEBUG)
+
+# The logger only queues the records, sent by the listener thread
+queue_size, policy = 10000, "drop-oldest"
+logHandler = DroppingQueueHandler(queue_size, policy)
 logHandler.setLevel(logging.DEBUG)
 logger.addHandler(logHandler)
+listener = BatchingQueueListener(logHandler.queue, udpHandler)
+listener.start()
 
 # logs with different levels
 logger.debug("debug msg")
 logger.info("info msg")
 logger.warning("warning msg")
 logger.error("error msg")
+
+# Send the queued records before exiting
+listener.stop()
+
+# Log the counters at shutdown, straight through the UDP handler now that the
+# listener stopped
+logger.removeHandler(logHandler)
+logger.addHandler(udpHandler)
+logger.info(
+    "Sent %d records in %d datagrams, dropped %d records",
+    udpHandler.sent,
+    udpHandler.datagrams,
+    logHandler.dropped + udpHandler.failed,
+)
+udpHandler.flush()
@@ -0,0 +1,184 @@
+import argparse
+import signal
+import sys
+import time
+
+import numpy as np
+
+from sudoku import SudokuGenerator, SudokuSolver
+
+# Hard puzzles with a unique solution, row by row, 0 for an empty cell
+HARD_PUZZLES = {
+    "Inkala 2012": (
+        "800000000"
+        "003600000"
+        "070090200"
+        "050007000"
+        "000045700"
+        "000100030"
+        "001000068"
+        "008500010"
+        "090000400"
+    ),
+    "Easter Monster": (
+        "100000002"
+        "090400050"
+        "006000700"
+        "050903000"
+        "000070000"
+        "000850040"
+        "700000600"
+        "030009080"
+        "002000001"
+    ),
+    "AI Escargot": (
+        "100007090"
+        "030020008"
+        "009600500"
+        "005300900"
+        "010080002"
+        "600004000"
+        "300000010"
+        "040000007"
+        "007000300"
+    ),
+    "17 clues #1": (
+        "400000805"
+        "030000000"
+        "000700000"
+        "020000060"
+        "000080400"
+        "000010000"
+        "000603070"
+        "500200000"
+        "104000000"
+    ),
+    "17 clues #2": (
+        "520006000"
+        "000000701"
+        "300000000"
+        "000400800"
+        "600000050"
+        "000000000"
+        "041800000"
+        "000030020"
+        "008700000"
+    ),
+    "17 clues #3": (
+        "600000803"
+        "040700000"
+        "000000000"
+        "000504070"
+        "300200000"
+        "106000000"
+        "020000050"
+        "000080600"
+        "000010000"
+    ),
+    "17 clues #4": (
+        "480300000"
+        "000000071"
+        "020000000"
+        "705000060"
+        "000200800"
+        "000000000"
+        "001076000"
+        "300000400"
+        "000050000"
+    ),
+    "Against backtracking": (
+        "000000000"
+        "000003085"
+        "001020000"
+        "000507000"
+        "004000100"
+        "090000000"
+        "500000073"
+        "002010000"
+        "000040009"
+    ),
+}
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        description="Compare the sudoku solvers on a corpus of hard puzzles"
+    )
+
+    parser.add_argument(
+        "-t",
+        "--timeout",
+        type=float,
+        default=10.0,
+        help="Give up solving a puzzle after this many seconds.",
+    )
+    parser.add_argument(
+        "-g",
+        "--generated",
+        type=int,
+        default=5,
+        help="Also solve this many generated puzzles, with --level given values.",
+    )
+    parser.add_argument("-l", "--level", type=int, default=20)
+
+    return parser.parse_args(argv)
+
+
+def timed_solve(solver: str, puzzle: np.array, timeout: float):
+    """Solve a copy of the puzzle, return the solution and the seconds taken,
+    or None and None after timeout seconds"""
+
+    def give_up(signum, frame):
+        raise TimeoutError
+
+    sudoku_solver = SudokuSolver(solver=solver, sudoku=puzzle.copy())
+    previous = signal.signal(signal.SIGALRM, give_up)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        start = time.perf_counter()
+        solution = sudoku_solver.solve()
+        seconds = time.perf_counter() - start
+    except TimeoutError:
+        return None, None
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+    return solution, seconds
+
+
+def main(args):
+    puzzles = {
+        name: np.array([int(v) for v in values]).reshape(9, 9)
+        for name, values in HARD_PUZZLES.items()
+    }
+    for seed in range(args.generated):
+        sg = SudokuGenerator(solver="bitmask")
+        sg.sudoku_generator(seed=seed, level=args.level)
+        puzzles[f"Generated, seed {seed}"] = sg.sudoku
+
+    print(f"{'puzzle':<22} {'givens':>6} {'backtrack (s)':>14} {'bitmask (s)':>12}")
+    totals = {"backtrack": 0.0, "bitmask": 0.0}
+    for name, puzzle in puzzles.items():
+        times = {}
+        for solver in ["backtrack", "bitmask"]:
+            solution, seconds = timed_solve(solver, puzzle, args.timeout)
+            if solution is None:
+                times[solver] = f">{args.timeout:g}"
+                totals[solver] += args.timeout
+                continue
+            times[solver] = f"{seconds:.4f}"
+            totals[solver] += seconds
+        print(
+            f"{name:<22} {np.count_nonzero(puzzle):>6} "
+            f"{times['backtrack']:>14} {times['bitmask']:>12}"
+        )
+
+    print(
+        f"{'total':<29} {totals['backtrack']:>14.2f} {totals['bitmask']:>12.4f}, "
+        f"speedup x{totals['backtrack'] / totals['bitmask']:.0f} "
+        "(at least, counting the timeouts as timeout seconds)"
+    )
+
+
+if __name__ == "__main__":
+    main(parse_arguments(sys.argv[1:]))
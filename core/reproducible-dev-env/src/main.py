@@ -1,7 +1,7 @@
 import argparse
 import sys
 
-from sudoku import SudokuGenerator
+from sudoku import SOLVERS, SudokuGenerator
 
 
 def parse_arguments(argv):
@@ -10,13 +10,14 @@ def parse_arguments(argv):
 
     parser.add_argument("-s", "--seed", type=str, default=42)
     parser.add_argument("-l", "--level", type=int, default=50)
+    parser.add_argument("--solver", choices=SOLVERS, default="backtrack")
 
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 
 def main(args):
-    print("seed=", args.seed, "level=", args.level)
-    sg = SudokuGenerator()
+    print("seed=", args.seed, "level=", args.level, "solver=", args.solver)
+    sg = SudokuGenerator(solver=args.solver)
     sg.sudoku_generator(seed=args.seed, level=args.level)
     print(sg.sudoku)
 
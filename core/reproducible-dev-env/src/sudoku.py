@@ -2,6 +2,17 @@ import random
 
 import numpy as np
 
+SOLVERS = ("backtrack", "bitmask")
+
+# Row, column and box of each of the 81 cells, in row-major order
+ROW = [i // 9 for i in range(81)]
+COL = [i % 9 for i in range(81)]
+BOX = [i // 27 * 3 + i % 9 // 3 for i in range(81)]
+# Bit 1 << v stands for the value v: all values 1 to 9
+ALL_VALUES = 0b1111111110
+# Number of values in each mask
+POPCOUNT = [bin(mask).count("1") for mask in range(ALL_VALUES + 1)]
+
 
 class Sudoku:
     def __init__(self, sudoku=None):
@@ -22,8 +33,16 @@ class Sudoku:
 class SudokuSolver(Sudoku):
     """Sudoku solver class"""
 
-    def __init__(self, **kwargs):
+    def __init__(self, solver: str = "backtrack", **kwargs):
         super().__init__(**kwargs)
+        assert solver in SOLVERS, f"Solver should be one of {SOLVERS}!"
+        self.solver = solver
+
+    def solve(self) -> np.array:
+        """Solve the sudoku with the chosen solver, False if it has no solution"""
+        if self.solver == "bitmask":
+            return self.sudoku_solver_bitmask()
+        return self.sudoku_solver_backtrack(0, 0)
 
     def sudoku_solver_backtrack(self, r: int = 0, c: int = 0) -> np.array:
 
@@ -46,6 +65,86 @@ class SudokuSolver(Sudoku):
             self.sudoku[r, c] = 0
         return False
 
+    def sudoku_solver_bitmask(self) -> np.array:
+        """Solve the sudoku with constraint propagation, iteratively.
+
+        The values used by each row, column and box are kept as bitmasks, so
+        the candidates of a cell are a few bitwise operations away. Cells with
+        a single candidate are filled right away (naked singles); otherwise the
+        search tries the values of the cell with the fewest candidates, and
+        backtracks with an explicit stack instead of recursion.
+        """
+        grid = [int(v) for v in self.sudoku.flat]
+        rows, cols, boxes = [0] * 9, [0] * 9, [0] * 9
+        for i, v in enumerate(grid):
+            if v:
+                bit = 1 << v
+                if (rows[ROW[i]] | cols[COL[i]] | boxes[BOX[i]]) & bit:
+                    return False
+                rows[ROW[i]] |= bit
+                cols[COL[i]] |= bit
+                boxes[BOX[i]] |= bit
+        empty = [i for i in range(81) if grid[i] == 0]
+
+        # Filled cells in order, and for each guess: the length of the trail
+        # before it, its cell and the values left to try
+        trail = []
+        stack = []
+
+        def fill(i, v):
+            bit = 1 << v
+            grid[i] = v
+            rows[ROW[i]] |= bit
+            cols[COL[i]] |= bit
+            boxes[BOX[i]] |= bit
+            trail.append(i)
+
+        def undo(length):
+            while len(trail) > length:
+                i = trail.pop()
+                bit = ~(1 << grid[i])
+                grid[i] = 0
+                rows[ROW[i]] &= bit
+                cols[COL[i]] &= bit
+                boxes[BOX[i]] &= bit
+
+        while True:
+            # Fill the naked singles, then find the cell with the fewest candidates
+            while True:
+                best, best_count, best_mask = -1, 10, 0
+                for i in empty:
+                    if grid[i] == 0:
+                        mask = ALL_VALUES & ~(
+                            rows[ROW[i]] | cols[COL[i]] | boxes[BOX[i]]
+                        )
+                        count = POPCOUNT[mask]
+                        if count < best_count:
+                            best, best_count, best_mask = i, count, mask
+                            if count <= 1:
+                                break
+                if best_count != 1:
+                    break
+                fill(best, best_mask.bit_length() - 1)
+
+            if best < 0:
+                self.sudoku.flat[:] = grid
+                return self.sudoku
+            if best_count > 1:
+                stack.append([len(trail), best, best_mask])
+
+            # Try the next value of the last guess, backtracking if none is left
+            while stack:
+                length, i, mask = stack[-1]
+                undo(length)
+                if mask:
+                    bit = mask & -mask
+                    stack[-1][2] = mask ^ bit
+                    fill(i, bit.bit_length() - 1)
+                    break
+                stack.pop()
+            else:
+                return False
+
 
 class SudokuGenerator(SudokuSolver):
     """Sudoku generator class"""
@@ -70,7 +169,7 @@ class SudokuGenerator(SudokuSolver):
             res[r, c] = 0
 
             self.sudoku = res.copy()
-            if self.sudoku_solver_backtrack(0, 0) is not False:
+            if self.solve() is not False:
                 remove_value.append((r, c))
                 res[r, c] = 0
         return res
@@ -93,6 +192,8 @@ class SudokuGenerator(SudokuSolver):
                     sudoku[3 * i + j, 3 * i : 3 * i + 3] = nums[3 * j : 3 * j + 3]
 
             self.sudoku = sudoku
+            # Always the backtrack solver: its first solution fixes the puzzle
+            # of the seed, whatever the solver
             sudoku = self.sudoku_solver_backtrack(0, 0)
             if sudoku is not False:
                 break
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The code is run from src, see the Dockerfile: import its modules the same way
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from benchmark_solver import HARD_PUZZLES
+from sudoku import SudokuGenerator, SudokuSolver
+
+
+def parse(values: str) -> np.array:
+    """Puzzle of 81 digits, row by row, 0 for an empty cell"""
+    return np.array([int(v) for v in values]).reshape(9, 9)
+
+
+def is_solution(solution: np.array, puzzle: np.array) -> bool:
+    """Check if solution is a complete and valid sudoku keeping the values of puzzle"""
+    values = set(range(1, 10))
+    return (
+        all(set(solution[r, :]) == values for r in range(9))
+        and all(set(solution[:, c]) == values for c in range(9))
+        and all(
+            set(solution[r : r + 3, c : c + 3].flat) == values
+            for r in range(0, 9, 3)
+            for c in range(0, 9, 3)
+        )
+        and bool((solution[puzzle != 0] == puzzle[puzzle != 0]).all())
+    )
+
+
+@pytest.mark.parametrize("name", HARD_PUZZLES)
+def test_bitmask_solves_hard_puzzles(name):
+    puzzle = parse(HARD_PUZZLES[name])
+    solution = SudokuSolver(solver="bitmask", sudoku=puzzle.copy()).solve()
+    assert solution is not False
+    assert is_solution(solution, puzzle)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_solvers_solve_generated_puzzles(seed):
+    generator = SudokuGenerator(solver="bitmask")
+    generator.sudoku_generator(seed=seed, level=30)
+    puzzle = generator.sudoku
+    # The puzzles may have several solutions: the solvers may find different ones
+    for solver in ["backtrack", "bitmask"]:
+        solution = SudokuSolver(solver=solver, sudoku=puzzle.copy()).solve()
+        assert is_solution(solution, puzzle)
+
+
+def test_same_puzzle_with_both_solvers():
+    puzzles = []
+    for solver in ["backtrack", "bitmask"]:
+        generator = SudokuGenerator(solver=solver)
+        generator.sudoku_generator(seed=42, level=40)
+        puzzles.append(generator.sudoku)
+    assert (puzzles[0] == puzzles[1]).all()
+
+
+@pytest.mark.parametrize("solver", ["backtrack", "bitmask"])
+def test_no_solution(solver):
+    # The last cell of the first row has no candidate left
+    puzzle = np.zeros((9, 9), dtype=int)
+    puzzle[0, :8] = range(1, 9)
+    puzzle[1, 8] = 9
+    assert SudokuSolver(solver=solver, sudoku=puzzle).solve() is False